@@ -0,0 +1,172 @@
+'''
+Precomputed attack tables for the bitboard backend: knight, king and pawn jumps plus the
+rook and bishop magic tables from RookMagicBitboard.
+
+Building the magic tables in pure Python takes a noticeable fraction of a second, which every
+fresh AI worker process would pay again. They are generated once into attack_tables.bin next to
+this file and memory-mapped on import; a missing, stale or corrupt file is rebuilt on the spot.
+'''
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+import RookMagicBitboard as magic
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attack_tables.bin")
+FILE_TAG = b"CHESSATK"
+FILE_VERSION = 1
+# Tag, version, fingerprint of the inputs, CRC-32 of the payload, number of 64-bit entries
+HEADER = struct.Struct("<8sIIII")
+HEADER_SIZE = HEADER.size  # 24 bytes, so the payload stays 8-byte aligned
+
+ROOK_MASKS = [magic.rook_occupancy_mask(square) for square in range(64)]
+BISHOP_MASKS = [magic.bishop_occupancy_mask(square) for square in range(64)]
+ROOK_SHIFTS = [64 - bin(mask).count('1') for mask in ROOK_MASKS]
+BISHOP_SHIFTS = [64 - bin(mask).count('1') for mask in BISHOP_MASKS]
+ROOK_MAGIC_NUMBERS = magic.ROOK_MAGIC_NUMBERS
+BISHOP_MAGIC_NUMBERS = magic.BISHOP_MAGIC_NUMBERS
+MASK_64 = magic.MASK_64
+
+
+def _leaper_attacks(offsets):
+    """
+    Build a 64-entry table of the squares reachable with a single jump for each offset.
+    """
+    table = []
+    for square in range(64):
+        attacks = 0
+        for d_rank, d_file in offsets:
+            r = square // 8 + d_rank
+            f = square % 8 + d_file
+            if 0 <= r < 8 and 0 <= f < 8:
+                attacks |= 1 << (r * 8 + f)
+        table.append(attacks)
+    return table
+
+
+def _layout():
+    """
+    Section names and sizes, in file order. The magic sections hold one block per square.
+    """
+    sections = [("knight", 64), ("king", 64), ("white_pawn", 64), ("black_pawn", 64)]
+    sections += [("rook", 1 << (64 - shift)) for shift in ROOK_SHIFTS]
+    sections += [("bishop", 1 << (64 - shift)) for shift in BISHOP_SHIFTS]
+    return sections
+
+
+def _fingerprint():
+    """
+    Changes whenever the magic numbers, the table layout or the byte order change.
+    """
+    inputs = array("Q", ROOK_MAGIC_NUMBERS + BISHOP_MAGIC_NUMBERS + ROOK_SHIFTS + BISHOP_SHIFTS)
+    return zlib.crc32(inputs.tobytes() + sys.byteorder.encode())
+
+
+def generate_tables():
+    """
+    Compute every table from scratch and return them concatenated in one flat array('Q').
+    """
+    tables = array("Q")
+    tables.extend(_leaper_attacks([(-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2)]))
+    tables.extend(_leaper_attacks([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]))
+    # Indexed by the square of the attacking pawn: white pawns capture towards row 0
+    tables.extend(_leaper_attacks([(-1, -1), (-1, 1)]))
+    tables.extend(_leaper_attacks([(1, -1), (1, 1)]))
+    for square in range(64):
+        tables.extend(magic.generate_rook_attack_table(square, ROOK_MAGIC_NUMBERS[square]))
+    for square in range(64):
+        tables.extend(magic.generate_bishop_attack_table(square, BISHOP_MAGIC_NUMBERS[square]))
+    return tables
+
+
+def save_tables(tables, path=TABLE_FILE):
+    """
+    Write tables to path, replacing any existing file atomically.
+    """
+    payload = tables.tobytes()
+    header = HEADER.pack(FILE_TAG, FILE_VERSION, _fingerprint(), zlib.crc32(payload), len(tables))
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as table_file:
+        table_file.write(header)
+        table_file.write(payload)
+    os.replace(temp_path, path)
+
+
+def load_tables(path=TABLE_FILE):
+    """
+    Memory-map the table file and return it as a flat memoryview of 64-bit entries,
+    or None if the file is missing or does not match this build.
+    """
+    try:
+        with open(path, "rb") as table_file:
+            mapped = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) < HEADER_SIZE:
+        return None
+    tag, version, fingerprint, checksum, count = HEADER.unpack_from(mapped)
+    if tag != FILE_TAG or version != FILE_VERSION or fingerprint != _fingerprint() or \
+            len(mapped) != HEADER_SIZE + count * 8:
+        return None
+    payload = memoryview(mapped)[HEADER_SIZE:]
+    if zlib.crc32(payload) != checksum:
+        return None
+    return payload.cast("Q")
+
+
+def _load_or_generate():
+    """
+    Load the persisted tables, falling back to generating (and, if possible, saving) them.
+    """
+    tables = load_tables()
+    if tables is None or len(tables) != sum(size for _, size in _layout()):
+        tables = generate_tables()
+        try:
+            save_tables(tables)
+        except OSError:
+            pass  # Read-only install: keep the freshly generated tables in memory
+    # Split into per-square lists; list indexing is faster than reading the map on every lookup
+    sections = {}
+    position = 0
+    for name, size in _layout():
+        sections.setdefault(name, []).append(tables[position:position + size].tolist())
+        position += size
+    return sections
+
+
+_SECTIONS = _load_or_generate()
+KNIGHT_ATTACKS = _SECTIONS["knight"][0]
+KING_ATTACKS = _SECTIONS["king"][0]
+# Indexed by the color of the attacking pawn (0 white, 1 black), then by square
+PAWN_ATTACKS = [_SECTIONS["white_pawn"][0], _SECTIONS["black_pawn"][0]]
+ROOK_ATTACK_TABLES = _SECTIONS["rook"]
+BISHOP_ATTACK_TABLES = _SECTIONS["bishop"]
+del _SECTIONS
+
+
+def rook_attacks(square, occupancy):
+    """
+    Squares attacked by a rook on square, up to and including the first blocker in each direction.
+    """
+    return ROOK_ATTACK_TABLES[square][
+        ((occupancy & ROOK_MASKS[square]) * ROOK_MAGIC_NUMBERS[square] & MASK_64) >> ROOK_SHIFTS[square]]
+
+
+def bishop_attacks(square, occupancy):
+    """
+    Squares attacked by a bishop on square, up to and including the first blocker in each direction.
+    """
+    return BISHOP_ATTACK_TABLES[square][
+        ((occupancy & BISHOP_MASKS[square]) * BISHOP_MAGIC_NUMBERS[square] & MASK_64) >> BISHOP_SHIFTS[square]]
+
+
+def queen_attacks(square, occupancy):
+    return rook_attacks(square, occupancy) | bishop_attacks(square, occupancy)
+
+
+if __name__ == "__main__":
+    save_tables(generate_tables())
+    print(f"wrote {TABLE_FILE}")
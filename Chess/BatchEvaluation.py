@@ -0,0 +1,73 @@
+"""
+Static evaluation of many positions at once with NumPy, for scoring large sets offline (test suites,
+labelling training data, annotating games) instead of one GameState at a time.
+A batch comes in one of two int8 layouts:
+    planes: (N, 12, 64), plane PIECES.index(piece) set to 1 on the squares holding that piece
+    codes:  (N, 64), PIECE_CODES[piece] on every square (0 for empty)
+Squares are numbered row * 8 + col as in GameState.board, and PIECES is the bitboard order.
+The scores are the material and piece-square part of the evaluation, tapered by game phase, in pawns
+for white: ChessAI.staticScore without the pawn structure.
+"""
+import numpy as np
+
+from BitboardEngine import PIECES
+from Evaluation import MAX_PHASE, PHASE_WEIGHTS, SQUARE_SCORES, unpackScore
+
+PIECE_CODES = {piece: index + 1 for index, piece in enumerate(PIECES)}
+PIECE_CODES["--"] = 0
+CHUNK_SIZE = 4096  # Positions evaluated per matrix product, to bound the memory of the float copy
+
+
+def _squareWeights():
+    """
+    (768, 3) weights of every piece plane and square (index PIECES.index(piece) * 64 + square): the
+    middlegame and endgame scores for white (black pieces count negative) and the phase weight.
+    """
+    weights = np.zeros((12, 64, 3), dtype=np.float32)
+    for index, piece in enumerate(PIECES):
+        sign = 1 if piece[0] == "w" else -1
+        for square in range(64):
+            midgame, endgame = unpackScore(SQUARE_SCORES[piece][square])
+            weights[index, square] = sign * midgame, sign * endgame, PHASE_WEIGHTS[piece[1]]
+    return weights.reshape(768, 3)
+
+
+SQUARE_WEIGHTS = _squareWeights()
+
+
+def encodeBoards(boards, planes=False):
+    """
+    Encode GameState boards (8x8 lists of piece strings, e.g. [game_state.board for ...]) as a batch of
+    piece codes, or of one-hot planes if planes is set.
+    """
+    codes = np.array([[PIECE_CODES[piece] for row in board for piece in row] for board in boards],
+                     dtype=np.int8).reshape(-1, 64)
+    return toPlanes(codes) if planes else codes
+
+
+def toPlanes(codes):
+    """
+    Turn an (N, 64) batch of piece codes into (N, 12, 64) one-hot planes.
+    """
+    codes = np.asarray(codes, dtype=np.int8)
+    return (codes[:, None, :] == np.arange(1, 13, dtype=np.int8)[None, :, None]).astype(np.int8)
+
+
+def evaluateBatch(batch):
+    """
+    Scores in pawns for white, as an array of N floats, of a batch in either layout.
+    """
+    batch = np.asarray(batch)
+    scores = np.empty(len(batch))
+    for start in range(0, len(batch), CHUNK_SIZE):
+        chunk = batch[start:start + CHUNK_SIZE]
+        if chunk.ndim == 2:
+            chunk = toPlanes(chunk)
+        # One product gives the middlegame score, endgame score and phase of every position
+        midgame, endgame, phase = (chunk.reshape(len(chunk), 768).astype(np.float32) @ SQUARE_WEIGHTS).T \
+            .astype(np.float64)
+        phase = np.minimum(phase, MAX_PHASE)
+        # Floored to whole centipawns like Evaluation.taperedScore
+        scores[start:start + len(chunk)] = np.floor((midgame * phase + endgame * (MAX_PHASE - phase)) /
+                                                    MAX_PHASE) / 100
+    return scores
@@ -0,0 +1,467 @@
+"""
+Bitboard backend for the game state.
+Keeps one 64-bit integer per piece plus occupancy masks and generates moves with
+attack table lookups instead of walking the 8x8 string board square by square.
+
+Making and undoing a move still goes through GameState.makeMoveCode (string board, Zobrist key,
+scores, logs) and then toggles the bitboards, so the gain is in move generation only. Since the
+string-board generator learnt to look outward from squares and use pin and check masks, that gain is
+modest: about 1.15x the board backend's perft speed (Perft.py --suite) and up to about 1.3x its
+search speed (Searcher at depth 5 on the start position and kiwipete, even on the middlegame position).
+"""
+from array import array
+
+from ChessEngine import GameState, CastleRights, SQUARE_COORDS, ALL_SQUARES, BETWEEN, LINE, PROMOTION_PIECES, \
+    DOUBLE_PAWN_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, ENPASSANT_CAPTURE, PROMOTION, TACTICAL, NO_MOVE, \
+    STAGE_CAPTURES, STAGE_KILLERS, STAGE_QUIETS
+from AttackTables import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks, queen_attacks
+
+# Squares are numbered row * 8 + col, so bit 0 is a8 and bit 63 is h1 (same layout as GameState.board)
+PIECES = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+PIECE_INDEX = {piece: index for index, piece in enumerate(PIECES)}
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PROMOTION_TYPES = [QUEEN, ROOK, BISHOP, KNIGHT]  # Same order as PROMOTION_PIECES
+PROMOTING_ROWS = [0xFF << 8, 0xFF << 48]  # Where the pawns of each color stand one push from promoting
+
+
+class BitboardGameState(GameState):
+    """
+    Drop-in replacement for GameState backed by bitboards.
+
+    self.board is still kept up to date (the UI, Move and the evaluation read it), but all
+    move generation and attack detection works on self.bitboards, one integer per entry of PIECES.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]  # All white pieces, all black pieces
+        self.target_mask = ALL_SQUARES  # Target squares wanted by the caller (e.g. only enemy pieces)
+        self.pin_masks = {}  # Square of a pinned piece -> line it may still move along
+        self.syncBitboards()
+
+    def syncBitboards(self):
+        """
+        Rebuild all bitboards from self.board.
+        """
+        self.bitboards = [0] * 12
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    self.bitboards[PIECE_INDEX[piece]] |= 1 << (row * 8 + col)
+        self.occupancy = [0, 0]
+        for index in range(6):
+            self.occupancy[WHITE] |= self.bitboards[index]
+            self.occupancy[BLACK] |= self.bitboards[index + 6]
+
+    def loadFEN(self, fen):
+        """
+        Set up the position described by a FEN string and rebuild the bitboards from it.
+        """
+        super().loadFEN(fen)
+        self.syncBitboards()
+
+    def makeMoveCode(self, code):
+        """
+        Makes a packed move on the board and mirrors it on the bitboards.
+        """
+        super().makeMoveCode(code)
+        self.toggleMove(*self.move_log.peek())
+
+    def undoMoveCode(self):
+        """
+        Reverts the last move on the bitboards and the board.
+        """
+        if len(self.move_log) != 0:
+            self.toggleMove(*self.move_log.peek())
+            super().undoMoveCode()
+
+    def toggleMove(self, code, piece_moved, piece_captured):
+        """
+        XOR a packed move in or out of the bitboards. Applying it twice restores the original position.
+        """
+        start_square = code & 63
+        end_square = code >> 6 & 63
+        flags = code >> 12
+        start = 1 << start_square
+        end = 1 << end_square
+        color = WHITE if piece_moved[0] == "w" else BLACK
+        moved_index = PIECE_INDEX[piece_moved]
+        self.bitboards[moved_index] ^= start
+        # What ends up on the destination square differs from the moved piece on promotion
+        self.bitboards[color * 6 + PROMOTION_TYPES[flags & 3] if flags & PROMOTION else moved_index] ^= end
+        self.occupancy[color] ^= start | end
+
+        if piece_captured != "--":
+            if flags == ENPASSANT_CAPTURE:
+                captured = 1 << (start_square & 56 | end_square & 7)
+            else:
+                captured = end
+            self.bitboards[PIECE_INDEX[piece_captured]] ^= captured
+            self.occupancy[color ^ 1] ^= captured
+
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            row_start = end_square & 56
+            if flags == KING_CASTLE:  # King-side rook h -> f
+                rook = (1 << (row_start + 7)) | (1 << (row_start + 5))
+            else:  # Queen-side rook a -> d
+                rook = (1 << row_start) | (1 << (row_start + 3))
+            self.bitboards[color * 6 + ROOK] ^= rook
+            self.occupancy[color] ^= rook
+
+    def attackersTo(self, square, occupancy, color):
+        """
+        Bitboard of all pieces of the given color attacking square, with sliders blocked by occupancy.
+        """
+        bitboards = self.bitboards
+        offset = color * 6
+        queens = bitboards[offset + QUEEN]
+        # A pawn of color attacks square exactly when a pawn of the other color on square would attack it
+        return (PAWN_ATTACKS[color ^ 1][square] & bitboards[offset + PAWN]) | \
+            (KNIGHT_ATTACKS[square] & bitboards[offset + KNIGHT]) | \
+            (KING_ATTACKS[square] & bitboards[offset + KING]) | \
+            (bishop_attacks(square, occupancy) & (bitboards[offset + BISHOP] | queens)) | \
+            (rook_attacks(square, occupancy) & (bitboards[offset + ROOK] | queens))
+
+    def cheapestAttacker(self, square, color, removed=0):
+        """
+        Square of the least valuable piece of color ("w" or "b") attacking square, or None,
+        ignoring (and seeing through) the pieces on the squares set in removed.
+        """
+        color = WHITE if color == "w" else BLACK
+        attackers = self.attackersTo(square, (self.occupancy[WHITE] | self.occupancy[BLACK]) & ~removed, color) & \
+            ~removed
+        if attackers:
+            for index in range(color * 6, color * 6 + 6):
+                found = attackers & self.bitboards[index]
+                if found:
+                    return (found & -found).bit_length() - 1
+        return None
+
+    def hasNonPawnMaterial(self):
+        """
+        Whether the side to move has a knight, bishop, rook or queen.
+        """
+        offset = (WHITE if self.white_to_move else BLACK) * 6
+        return any(self.bitboards[offset + KNIGHT:offset + KING])
+
+    def pawnBitboards(self):
+        return self.bitboards[WHITE * 6 + PAWN], self.bitboards[BLACK * 6 + PAWN]
+
+    def kingSquare(self, color):
+        return self.bitboards[color * 6 + KING].bit_length() - 1
+
+    def inCheck(self):
+        """
+        Check if the current player is in check.
+        """
+        color = WHITE if self.white_to_move else BLACK
+        return self.attackersTo(self.kingSquare(color), self.occupancy[WHITE] | self.occupancy[BLACK], color ^ 1) != 0
+
+    def squareUnderAttack(self, row, col):
+        """
+        Check if a square is under attack by the opponent.
+        """
+        enemy = BLACK if self.white_to_move else WHITE
+        return self.attackersTo(row * 8 + col, self.occupancy[WHITE] | self.occupancy[BLACK], enemy) != 0
+
+    def findPins(self, king_square, color):
+        """
+        Map each piece of color pinned to its king onto the line it is still allowed to move along.
+        """
+        pin_masks = {}
+        enemy_offset = (color ^ 1) * 6
+        queens = self.bitboards[enemy_offset + QUEEN]
+        occupancy = self.occupancy[WHITE] | self.occupancy[BLACK]
+        own = self.occupancy[color]
+        # Enemy sliders that would see the king on an empty board
+        snipers = (rook_attacks(king_square, 0) & (self.bitboards[enemy_offset + ROOK] | queens)) | \
+                  (bishop_attacks(king_square, 0) & (self.bitboards[enemy_offset + BISHOP] | queens))
+        while snipers:
+            low = snipers & -snipers
+            snipers ^= low
+            sniper_square = low.bit_length() - 1
+            blockers = BETWEEN[king_square][sniper_square] & occupancy
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pin_masks[blockers.bit_length() - 1] = LINE[king_square][sniper_square]
+        return pin_masks
+
+    def getValidMoveCodes(self):
+        """
+        Returns all valid moves as packed codes, taking checks into account.
+        """
+        temp_castle_rights = CastleRights(self.current_castling_rights.wks,
+                                          self.current_castling_rights.bks,
+                                          self.current_castling_rights.wqs,
+                                          self.current_castling_rights.bqs)
+        color = WHITE if self.white_to_move else BLACK
+        king_square = self.kingSquare(color)
+        checkers = self.attackersTo(king_square, self.occupancy[WHITE] | self.occupancy[BLACK], color ^ 1)
+        self.in_check = checkers != 0
+        self.pin_masks = self.findPins(king_square, color)
+        king_row, king_col = SQUARE_COORDS[king_square]
+
+        moves = array("H")
+        if checkers & (checkers - 1):
+            # If there are two checks, the king must move
+            self.getKingMoves(king_row, king_col, moves)
+        else:
+            if checkers:
+                # Capture the checking piece or block the line between it and the king
+                self.check_mask = checkers | BETWEEN[king_square][checkers.bit_length() - 1]
+            moves = self.getAllPossibleMoveCodes()
+            if not checkers:
+                self.getCastleMoves(king_row, king_col, moves)
+        self.check_mask = ALL_SQUARES
+        self.pin_masks = {}
+
+        if len(moves) == 0:
+            if self.in_check:
+                self.checkmate = True  # No valid moves and in check = checkmate
+            else:
+                self.stalemate = True  # No valid moves and not in check = stalemate
+
+        self.current_castling_rights = temp_castle_rights
+        return moves
+
+    def iterMoves(self, hash_move=NO_MOVE, killers=(), stage=STAGE_QUIETS, legal=True, history=None):
+        """
+        Staged version of GameState.iterMoves: captures and quiet moves are generated separately,
+        and the hash and killer moves are checked by generating the moves of their piece only.
+        """
+        color = WHITE if self.white_to_move else BLACK
+        king_square = self.kingSquare(color)
+        # Pseudo-legal moves ignore checks and pins; the caller tests each one after making it
+        checkers = self.attackersTo(king_square, self.occupancy[WHITE] | self.occupancy[BLACK], color ^ 1) \
+            if legal else 0
+        if not checkers:
+            check_mask = ALL_SQUARES
+        elif checkers & (checkers - 1):
+            check_mask = 0  # Double check: only the king can move
+        else:
+            check_mask = checkers | BETWEEN[king_square][checkers.bit_length() - 1]
+        pin_masks = self.findPins(king_square, color) if legal else {}
+        enemy = self.occupancy[color ^ 1]
+        quiet = ALL_SQUARES ^ enemy
+
+        # The caller makes and undoes moves between stages, so the masks are kept here, not on self
+        if hash_move and hash_move in self.generateMoves(check_mask, pin_masks, ALL_SQUARES, not checkers,
+                                                         hash_move & 63, legal):
+            yield hash_move
+        else:
+            hash_move = NO_MOVE
+        if stage < STAGE_CAPTURES:
+            return
+        tactical = self.generateMoves(check_mask, pin_masks, enemy, False, legal=legal)
+        # Pushes that promote are searched with the captures
+        pawns = self.bitboards[color * 6 + PAWN] & PROMOTING_ROWS[color]
+        while pawns:
+            low = pawns & -pawns
+            pawns ^= low
+            tactical += self.generateMoves(check_mask, pin_masks, quiet, False, low.bit_length() - 1, legal)
+        for move in self.sortCaptures(tactical):
+            if move != hash_move:
+                yield move
+        if stage < STAGE_KILLERS:
+            return
+        played = [hash_move]
+        for killer in killers:
+            if killer not in played and not killer & TACTICAL << 12 and \
+                    killer in self.generateMoves(check_mask, pin_masks, quiet, not checkers, killer & 63, legal):
+                played.append(killer)
+                yield killer
+        if stage < STAGE_QUIETS:
+            return
+        quiets = self.generateMoves(check_mask, pin_masks, quiet, not checkers, legal=legal)
+        if history is not None:
+            quiets = sorted(quiets, key=lambda move: history[move & 4095], reverse=True)
+        for move in quiets:
+            if move not in played and not move & PROMOTION << 12:
+                yield move
+
+    def getPseudoLegalMoveCodes(self):
+        """
+        Returns the moves allowed by the piece rules as packed codes, without pin and king safety tests.
+        """
+        return self.generateMoves(ALL_SQUARES, {}, ALL_SQUARES, True, legal=False)
+
+    def moveLeftKingInCheck(self):
+        """
+        After makeMoveCode, check whether the side that just moved left its own king attacked.
+        """
+        color = BLACK if self.white_to_move else WHITE
+        return self.attackersTo(self.kingSquare(color), self.occupancy[WHITE] | self.occupancy[BLACK], color ^ 1) != 0
+
+    def generateMoves(self, check_mask, pin_masks, target_mask, castle, square=None, legal=True):
+        """
+        Valid moves landing on target_mask for the side to move, or only for the piece on square,
+        given the check and pin restrictions from iterMoves. Castling is added if castle is set.
+        With legal=False the king moves and en passant captures are not tested for king safety either.
+        """
+        self.pseudo_legal = not legal
+        self.check_mask = check_mask
+        self.pin_masks = pin_masks
+        self.target_mask = target_mask
+        if square is None:
+            moves = self.getAllPossibleMoveCodes()
+        else:
+            moves = array("H")
+            row, col = SQUARE_COORDS[square]
+            piece = self.board[row][col]
+            if piece[0] == ("w" if self.white_to_move else "b"):
+                self.moveFunctions[piece[1]](row, col, moves)
+        if castle:
+            king_square = self.kingSquare(WHITE if self.white_to_move else BLACK)
+            if square is None or square == king_square:
+                self.getCastleMoves(SQUARE_COORDS[king_square][0], SQUARE_COORDS[king_square][1], moves)
+        self.check_mask = ALL_SQUARES
+        self.pin_masks = {}
+        self.target_mask = ALL_SQUARES
+        self.pseudo_legal = False
+        return moves
+
+    def getAllPossibleMoveCodes(self):
+        """
+        Get all possible moves for the side to move, restricted by self.check_mask and self.pin_masks.
+        Outside getValidMoves those are empty, so only king moves are filtered for safety.
+        """
+        moves = array("H")
+        offset = 0 if self.white_to_move else 6
+        for index in range(offset, offset + 6):
+            move_function = self.moveFunctions[PIECES[index][1]]
+            pieces = self.bitboards[index]
+            while pieces:
+                low = pieces & -pieces
+                pieces ^= low
+                row, col = SQUARE_COORDS[low.bit_length() - 1]
+                move_function(row, col, moves)
+        return moves
+
+    def addMoves(self, square, targets, moves):
+        """
+        Append a packed move from square to every square set in targets.
+        """
+        enemy = self.occupancy[BLACK if self.white_to_move else WHITE]
+        capture = square | CAPTURE << 12
+        while targets:
+            low = targets & -targets
+            targets ^= low
+            # Same layout as packMove, inlined: this is the innermost loop of move generation
+            moves.append((capture if low & enemy else square) | (low.bit_length() - 1) << 6)
+
+    def allowedTargets(self, square):
+        """
+        Squares a (non-king) piece on square may move to without leaving its king in check.
+        """
+        return self.check_mask & self.target_mask & self.pin_masks.get(square, ALL_SQUARES)
+
+    def getPawnMoves(self, row, col, moves):
+        """
+        Get all possible moves for a pawn at (row, col).
+        """
+        square = row * 8 + col
+        allowed = self.allowedTargets(square)
+        occupancy = self.occupancy[WHITE] | self.occupancy[BLACK]
+        if self.white_to_move:
+            color, step, start_row = WHITE, -8, 6
+        else:
+            color, step, start_row = BLACK, 8, 1
+
+        one_step = square + step
+        if not occupancy & (1 << one_step):  # Move 1 square forward
+            targets = 1 << one_step
+            if row == start_row and not occupancy & (1 << (one_step + step)) and allowed & (1 << (one_step + step)):
+                # Move 2 squares forward
+                moves.append(square | (one_step + step) << 6 | DOUBLE_PAWN_PUSH << 12)
+        else:
+            targets = 0
+        attacks = PAWN_ATTACKS[color][square]
+        targets |= attacks & self.occupancy[color ^ 1]
+        targets &= allowed
+        if row + step // 8 in (0, 7):
+            # Reaching the last rank: one move per promotion piece
+            enemy = self.occupancy[color ^ 1]
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                flags = PROMOTION | CAPTURE if low & enemy else PROMOTION
+                end = (low.bit_length() - 1) << 6
+                for index in range(len(PROMOTION_PIECES)):
+                    moves.append(square | end | (flags | index) << 12)
+        else:
+            self.addMoves(square, targets, moves)
+
+        if self.enpassant_possible:
+            enpassant_square = self.enpassant_possible[0] * 8 + self.enpassant_possible[1]
+            captured = enpassant_square - 8 if color == BLACK else enpassant_square + 8
+            if attacks & (1 << enpassant_square) and self.target_mask & (1 << captured) and \
+                    (self.pseudo_legal or self.enpassantIsLegal(square, enpassant_square, color)):
+                moves.append(square | enpassant_square << 6 | ENPASSANT_CAPTURE << 12)
+
+    def enpassantIsLegal(self, square, enpassant_square, color):
+        """
+        En passant removes two pieces from one rank, so test it directly on the resulting occupancy.
+        """
+        captured = 1 << (enpassant_square - 8 if color == BLACK else enpassant_square + 8)
+        occupancy = (self.occupancy[WHITE] | self.occupancy[BLACK]) ^ (1 << square) ^ captured | (1 << enpassant_square)
+        return not self.attackersTo(self.kingSquare(color), occupancy, color ^ 1) & ~captured
+
+    def getRookMoves(self, row, col, moves):
+        """
+        Get all possible moves for a rook at (row, col).
+        """
+        square = row * 8 + col
+        own = self.occupancy[WHITE if self.white_to_move else BLACK]
+        attacks = rook_attacks(square, self.occupancy[WHITE] | self.occupancy[BLACK])
+        self.addMoves(square, attacks & ~own & self.allowedTargets(square), moves)
+
+    def getKnightMoves(self, row, col, moves):
+        """
+        Get all possible moves for a knight at (row, col).
+        """
+        square = row * 8 + col
+        if square in self.pin_masks:
+            return  # A pinned knight can never stay on the pin line
+        own = self.occupancy[WHITE if self.white_to_move else BLACK]
+        self.addMoves(square, KNIGHT_ATTACKS[square] & ~own & self.check_mask & self.target_mask, moves)
+
+    def getBishopMoves(self, row, col, moves):
+        """
+        Get all possible moves for a bishop at (row, col).
+        """
+        square = row * 8 + col
+        own = self.occupancy[WHITE if self.white_to_move else BLACK]
+        attacks = bishop_attacks(square, self.occupancy[WHITE] | self.occupancy[BLACK])
+        self.addMoves(square, attacks & ~own & self.allowedTargets(square), moves)
+
+    def getQueenMoves(self, row, col, moves):
+        """
+        Get all possible moves for a queen at (row, col).
+        """
+        square = row * 8 + col
+        own = self.occupancy[WHITE if self.white_to_move else BLACK]
+        occupancy = self.occupancy[WHITE] | self.occupancy[BLACK]
+        attacks = queen_attacks(square, occupancy)
+        self.addMoves(square, attacks & ~own & self.allowedTargets(square), moves)
+
+    def getKingMoves(self, row, col, moves):
+        """
+        Get all possible moves for a king at (row, col). The king is taken off the board while
+        testing each target so it cannot hide behind itself on a checking line.
+        """
+        square = row * 8 + col
+        color = WHITE if self.white_to_move else BLACK
+        occupancy = (self.occupancy[WHITE] | self.occupancy[BLACK]) ^ (1 << square)
+        targets = KING_ATTACKS[square] & ~self.occupancy[color] & self.target_mask
+        if self.pseudo_legal:
+            self.addMoves(square, targets, moves)
+            return
+        safe = 0
+        while targets:
+            low = targets & -targets
+            targets ^= low
+            if not self.attackersTo(low.bit_length() - 1, occupancy, color ^ 1):
+                safe |= low
+        self.addMoves(square, safe, moves)
@@ -1,105 +1,806 @@
 """
 Handling the AI moves.
 """
+import queue
 import random
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, wait
+from multiprocessing import Event, Process, Queue
 
-piece_score = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
-
-knight_scores = [[0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
-                 [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
-                 [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
-                 [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
-                 [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
-                 [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
-                 [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0]]
-
-bishop_scores = [[0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-                 [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                 [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
-                 [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
-                 [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
-                 [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
-                 [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
-                 [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0]]
-
-rook_scores = [[0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
-               [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25]]
-
-queen_scores = [[0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-                [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0]]
-
-pawn_scores = [[0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
-               [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
-               [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
-               [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
-               [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
-               [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
-               [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
-               [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]]
-
-piece_position_scores = {"wN": knight_scores,
-                         "bN": knight_scores[::-1],
-                         "wB": bishop_scores,
-                         "bB": bishop_scores[::-1],
-                         "wQ": queen_scores,
-                         "bQ": queen_scores[::-1],
-                         "wR": rook_scores,
-                         "bR": rook_scores[::-1],
-                         "wp": pawn_scores,
-                         "bp": pawn_scores[::-1]}
+from ChessEngine import NO_MOVE, TACTICAL, PROMOTION, STAGE_CAPTURES, EXCHANGE_VALUES
+from Evaluation import taperedScore
+from PawnStructure import PawnHashTable, pawnScore
+from ScoreCache import ScoreCache
+from TranspositionTable import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
 
 CHECKMATE = 1000
 STALEMATE = 0
-DEPTH = 4
-
-
-def findBestMove(game_state, valid_moves, return_queue):
-    global next_move
-    next_move = None
-    random.shuffle(valid_moves)
-    findMoveNegaMaxAlphaBeta(game_state, valid_moves, DEPTH, -CHECKMATE, CHECKMATE,
-                             1 if game_state.white_to_move else -1)
-    return_queue.put(next_move)
-
-
-def findMoveNegaMaxAlphaBeta(game_state, valid_moves, depth, alpha, beta, turn_multiplier):
-    global next_move
-    if depth == 0:
-        return turn_multiplier * scoreBoard(game_state)
-    # move ordering - implement later //TODO
-    max_score = -CHECKMATE
-    for move in valid_moves:
-        game_state.makeMove(move)
-        next_moves = game_state.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
-        if score > max_score:
-            max_score = score
-            if depth == DEPTH:
-                next_move = move
-        game_state.undoMove()
-        if max_score > alpha:
-            alpha = max_score
-        if alpha >= beta:
-            break
-    return max_score
-
-
-def scoreBoard(game_state):
+DEPTH = 4  # Search depth when no time or node limit is given
+MAX_DEPTH = 64  # Deepest iteration when searching on time or nodes
+TRANSPOSITION_TABLE_MB = 16
+MOVES_TO_GO = 30  # Assume this many moves remain when budgeting time from the clock
+TIME_CHECK_INTERVAL = 1024  # Nodes between looks at the clock
+HISTORY_MAX = 1 << 20  # History scores are halved once one of them grows past this
+DELTA_MARGIN = 2  # Quiescence skips captures that cannot raise the score to alpha even with this much to spare
+NULL_WINDOW = 0.001  # Width of the scout searches; below the smallest score difference the evaluation makes
+ASPIRATION_WINDOW = 0.5  # Each iteration first searches this far either side of the previous score
+# Null-move pruning: at this remaining depth or more, let the opponent move twice in a row; if the
+# position still fails high, searched NULL_MOVE_REDUCTION plies shallower, prune it
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+# Late move reductions: quiet moves after the first LMR_FULL_DEPTH_MOVES of a node are searched
+# LMR_REDUCTION plies shallower (one more after LMR_DEEP_MOVES), and again at full depth if they beat alpha
+LMR_MIN_DEPTH = 3
+LMR_FULL_DEPTH_MOVES = 3
+LMR_DEEP_MOVES = 8
+LMR_REDUCTION = 1
+HISTORY_JITTER = 64  # Lazy SMP helpers start from random history scores below this, to vary their move order
+HELPER_POLL_INTERVAL = 0.1  # Seconds between checks that lazy SMP helpers are still alive while waiting on them
+ROOT_SPLIT_TABLE_MB = 4  # Transposition table of each root move search in a RootSplitSearcher worker
+EVALUATION_CACHE_ENTRIES = 1 << 16  # Static scores remembered per Searcher; a power of two
+
+# Set in each RootSplitSearcher worker process by initRootWorker: tells running tasks to stop
+root_worker_stop_event = None
+
+
+class SearchLimits:
+    """
+    When a search should stop. move_time is a fixed budget in milliseconds; time_left and increment
+    (also milliseconds) describe the remaining clock instead; nodes caps the positions searched. The
+    search deepens one ply at a time until depth or a limit is reached. Without any limit it stops at DEPTH.
+    """
+
+    def __init__(self, depth=None, move_time=None, time_left=None, increment=0, nodes=None):
+        self.move_time = move_time
+        self.time_left = time_left
+        self.increment = increment
+        self.nodes = nodes
+        if depth is None:
+            depth = DEPTH if move_time is None and time_left is None and nodes is None else MAX_DEPTH
+        self.depth = min(depth, MAX_DEPTH)
+
+    def timeBudget(self):
+        """
+        Seconds to spend on this move, or None for no time limit.
+        """
+        if self.move_time is not None:
+            return self.move_time / 1000
+        if self.time_left is not None:
+            budget = self.time_left / MOVES_TO_GO + self.increment * 3 / 4
+            # Never plan to use the whole clock: keep a margin for the move itself
+            return max(min(budget, self.time_left - 50), 1) / 1000
+        return None
+
+
+class SearchResult:
+    """
+    What Searcher.search found: best_move is a packed move code (NO_MOVE when there is no legal move),
+    score is from the point of view of the side to move, pv the expected line starting with best_move,
+    depth the last completed iteration, nodes the positions searched and time the seconds it took.
+    eval_cache_hits and eval_cache_misses count the static evaluations found in and added to the
+    EvaluationCache.
+    """
+    __slots__ = ("best_move", "score", "pv", "depth", "nodes", "time", "eval_cache_hits", "eval_cache_misses")
+
+    def __init__(self, best_move=NO_MOVE, score=0, pv=(), depth=0, nodes=0, time=0.0, eval_cache_hits=0,
+                 eval_cache_misses=0):
+        self.best_move = best_move
+        self.score = score
+        self.pv = list(pv)
+        self.depth = depth
+        self.nodes = nodes
+        self.time = time
+        self.eval_cache_hits = eval_cache_hits
+        self.eval_cache_misses = eval_cache_misses
+
+
+class EvaluationCache(ScoreCache):
+    """
+    Cache of static scores (see staticScore) by Zobrist key, in front of the evaluation, for positions
+    reached again through transpositions.
+    """
+
+    def __init__(self, entries=EVALUATION_CACHE_ENTRIES):
+        super().__init__(entries, "d")
+
+
+class Searcher:
+    """
+    A search engine with its own transposition table, move ordering tables and search state.
+    Keep one per game, so later searches reuse what earlier ones found; separate Searchers share
+    nothing and can run side by side in threads or worker processes.
+    For lazy SMP (see lazySMPSearch) the table can be created in shared memory (shared_table) or an
+    existing one passed in; stop_event is a multiprocessing.Event that stops the search once set, and
+    depth_offset makes every iteration that many plies deeper.
+    """
+
+    def __init__(self, transposition_table_mb=TRANSPOSITION_TABLE_MB, shared_table=False, transposition_table=None,
+                 stop_event=None, depth_offset=0):
+        self.transposition_table = transposition_table or TranspositionTable(transposition_table_mb, shared_table)
+        self.evaluation_cache = EvaluationCache()
+        self.pawn_hash_table = PawnHashTable()
+        self.stop_event = stop_event
+        self.depth_offset = depth_offset
+        # Move ordering: two quiet moves per ply that recently caused a beta cutoff, and for every
+        # from/to square pair (move & 4095) a score of how often a quiet move between them did
+        self.killer_moves = [[NO_MOVE, NO_MOVE] for _ in range(MAX_DEPTH + 1)]
+        self.history_table = array("l", [0]) * 4096
+        self.pv_table = [[] for _ in range(MAX_DEPTH + 1)]  # pv_table[ply]: best line found from that ply
+        self.previous_pv = []  # Principal variation of the last completed iteration
+        self.nodes_searched = 0
+        self.stopped = False
+        self.limits = SearchLimits()
+        self.ponder_hit = None  # Set while pondering, see search
+        self.budget_start = 0.0  # When the search started, pondering included; the time budget counts from here
+        self.deadline = None
+        self.node_limit = None
+        self.max_depth = DEPTH
+
+    def newGame(self):
+        """
+        Forget the search results of the previous game.
+        """
+        self.transposition_table.clear()
+        for index in range(len(self.history_table)):
+            self.history_table[index] = 0
+
+    def stop(self):
+        """
+        Make a running search (e.g. in another thread) return as soon as possible,
+        with the result of its last completed iteration.
+        """
+        self.stopped = True
+
+    def search(self, game_state, limits=None, root_moves=None, ponder_hit=None):
+        """
+        Search game_state with iterative deepening and return a SearchResult for the last completed
+        iteration. limits is a SearchLimits, by default going to DEPTH; root_moves optionally restricts
+        the search to these move codes. game_state is back in its original position afterwards.
+        Given a ponder_hit event (threading or multiprocessing) the search ponders: it ignores limits
+        and goes as deep as it can until the event is set, then goes on under limits. The time and nodes
+        spent pondering count against them, so after a long ponder the search may return at once.
+        """
+        limits = limits or SearchLimits()
+        start_time = time.perf_counter()
+        self.startSearch(limits, start_time, ponder_hit)
+        if root_moves is None:
+            root_moves = game_state.getValidMoveCodes()
+        # Always searched as a list, which tells the negamax it is at the root
+        root_moves = array("H", root_moves)
+        result = SearchResult()
+        depth = self.depth_offset
+        while depth < min(self.max_depth + self.depth_offset, MAX_DEPTH):
+            depth += 1
+            score = self.aspirationSearch(game_state, root_moves, depth, result.score if result.depth else None)
+            if self.stopped:
+                break  # Unfinished iteration: keep the result of the one before
+            self.previous_pv = self.pv_table[0]
+            result = SearchResult(self.previous_pv[0] if self.previous_pv else NO_MOVE, score, self.previous_pv,
+                                  depth)
+            if abs(score) >= CHECKMATE:
+                break  # Forced mate (or being mated) found, deeper search cannot change it
+            # An iteration takes several times longer than the one before: do not start one that cannot finish
+            self.checkPonderHit()
+            if self.deadline is not None and \
+                    time.perf_counter() - self.budget_start > (self.deadline - self.budget_start) / 2:
+                break
+        result.nodes = self.nodes_searched
+        result.time = time.perf_counter() - start_time
+        result.eval_cache_hits = self.evaluation_cache.hits
+        result.eval_cache_misses = self.evaluation_cache.misses
+        return result
+
+    def startSearch(self, limits, start_time, ponder_hit=None):
+        """
+        Reset the search state and set the budget of limits, counted from start_time (time.perf_counter()).
+        While pondering (see search) there is no budget until ponder_hit is set.
+        """
+        self.nodes_searched = 0
+        self.evaluation_cache.hits = self.evaluation_cache.misses = 0
+        self.limits = limits
+        self.ponder_hit = ponder_hit
+        self.budget_start = start_time
+        self.setBudget(SearchLimits(MAX_DEPTH) if ponder_hit is not None else limits)
+        self.stopped = False
+        self.previous_pv = []
+        self.transposition_table.newSearch()
+        self.ageHistory()
+        for killers in self.killer_moves:
+            killers[0] = killers[1] = NO_MOVE
+
+    def setBudget(self, limits):
+        """
+        Apply the depth, time and node limits, counted from the start of the search.
+        """
+        budget = limits.timeBudget()
+        self.deadline = self.budget_start + budget if budget is not None else None
+        self.node_limit = limits.nodes
+        self.max_depth = limits.depth
+
+    def checkPonderHit(self):
+        """
+        Once the move being pondered on is played, switch from pondering to the real limits, counted from
+        the start of the ponder search.
+        """
+        if self.ponder_hit is not None and self.ponder_hit.is_set():
+            self.ponder_hit = None
+            self.setBudget(self.limits)
+
+    def aspirationSearch(self, game_state, root_moves, depth, previous_score):
+        """
+        Search the root to depth in a narrow window around previous_score (the result of the iteration
+        before, None for a full window). When the score falls outside, the window is widened on that
+        side and the root searched again until the score lands inside it.
+        """
+        turn_multiplier = 1 if game_state.white_to_move else -1
+        if previous_score is None or abs(previous_score) >= CHECKMATE:
+            return self.negamax(game_state, root_moves, depth, -CHECKMATE, CHECKMATE, turn_multiplier, on_pv=True)
+        window = ASPIRATION_WINDOW
+        alpha = max(previous_score - window, -CHECKMATE)
+        beta = min(previous_score + window, CHECKMATE)
+        while True:
+            score = self.negamax(game_state, root_moves, depth, alpha, beta, turn_multiplier, on_pv=True)
+            if self.stopped:
+                return score
+            window *= 4
+            if score <= alpha and alpha > -CHECKMATE:
+                alpha = max(score - window, -CHECKMATE)
+            elif score >= beta and beta < CHECKMATE:
+                beta = min(score + window, CHECKMATE)
+            else:
+                return score
+
+    def checkLimits(self):
+        """
+        Stop the search once the time or node budget is used up, or another process asks it to.
+        """
+        self.checkPonderHit()
+        if (self.deadline is not None and time.perf_counter() >= self.deadline) or \
+                (self.node_limit is not None and self.nodes_searched >= self.node_limit) or \
+                (self.stop_event is not None and self.stop_event.is_set()):
+            self.stopped = True
+
+    def ageHistory(self):
+        """
+        Halve every history score, so what was learned in earlier searches counts less than new cutoffs.
+        """
+        history_table = self.history_table
+        for index in range(len(history_table)):
+            history_table[index] >>= 1
+
+    def recordCutoff(self, move, depth, ply):
+        """
+        Remember a quiet move that caused a beta cutoff as a killer for this ply and in the history table.
+        """
+        killers = self.killer_moves[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history_table[move & 4095] += depth * depth
+        if self.history_table[move & 4095] > HISTORY_MAX:
+            self.ageHistory()
+
+    def negamax(self, game_state, valid_moves, depth, alpha, beta, turn_multiplier, ply=0, on_pv=False,
+                allow_null=True):
+        """
+        Principal variation search (negamax with alpha-beta pruning) over packed move codes: the first move
+        gets the full window, the others a null window around alpha that only proves them worse, and are
+        searched again with the full window if that fails. Outside the principal variation a null move
+        (see NULL_MOVE_MIN_DEPTH) may prune the node first, unless allow_null is cleared because the move
+        before was one already, and late quiet moves are searched at reduced depth (see LMR_MIN_DEPTH).
+        valid_moves is the list to search at the root; below it pass None and the moves are generated here.
+        Moves are searched hash move first, then captures by MVV-LVA, the killer moves of this ply and the
+        other quiet moves by history score. Every result is stored in the transposition table and probed
+        before searching a position again.
+        on_pv is set while following the principal variation of the previous iteration, whose moves are
+        then searched first. The best line from this node ends up in pv_table[ply].
+        Once the search is stopped the returned scores are meaningless and nothing more is stored.
+        """
+        self.nodes_searched += 1
+        if self.nodes_searched % TIME_CHECK_INTERVAL == 0:
+            self.checkLimits()
+        pv_table = self.pv_table
+        pv_table[ply] = []
+        if self.stopped:
+            return 0
+        if depth == 0:
+            return self.quiescence(game_state, alpha, beta, turn_multiplier)
+        key = game_state.zobrist_key
+        hash_move = NO_MOVE
+        entry = self.transposition_table.probe(key)
+        if entry is not None:
+            hash_move, entry_depth, bound, score = entry
+            # The root still has to search, it needs a move
+            if entry_depth >= depth and ply > 0 and \
+                    (bound == EXACT or (bound == LOWER_BOUND and score >= beta) or
+                     (bound == UPPER_BOUND and score <= alpha)):
+                return score
+        if on_pv and ply < len(self.previous_pv):
+            hash_move = self.previous_pv[ply]
+        else:
+            on_pv = False
+        in_check = depth >= min(NULL_MOVE_MIN_DEPTH, LMR_MIN_DEPTH) and game_state.inCheck()
+        if allow_null and ply > 0 and depth >= NULL_MOVE_MIN_DEPTH and beta - alpha < 2 * NULL_WINDOW and \
+                not in_check and game_state.hasNonPawnMaterial() and \
+                turn_multiplier * scoreBoard(game_state, self.evaluation_cache, self.pawn_hash_table) >= beta:
+            game_state.makeNullMove()
+            score = -self.negamax(game_state, None, max(depth - 1 - NULL_MOVE_REDUCTION, 0), -beta,
+                                  -beta + NULL_WINDOW, -turn_multiplier, ply + 1, allow_null=False)
+            game_state.undoNullMove()
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return beta if score >= CHECKMATE else score  # A mate found after passing proves nothing
+        if valid_moves is None:
+            # Generated lazily, stage by stage and without legality tests, so a cutoff
+            # skips the rest of the moves and only the moves actually played are checked
+            valid_moves = game_state.iterMoves(hash_move, self.killer_moves[ply], legal=False,
+                                               history=self.history_table)
+        else:
+            root_moves = set(valid_moves)
+            valid_moves = [move for move in game_state.iterMoves(hash_move, self.killer_moves[ply],
+                                                                 history=self.history_table)
+                           if move in root_moves]
+        original_alpha = alpha
+        max_score = -CHECKMATE
+        best_move = NO_MOVE
+        killers = self.killer_moves[ply]
+        searched = 0
+        for move in valid_moves:
+            game_state.makeMoveCode(move)
+            if game_state.moveLeftKingInCheck():  # Pseudo-legal move that turned out to be illegal
+                game_state.undoMoveCode()
+                continue
+            searched += 1
+            if not best_move:
+                score = -self.negamax(game_state, None, depth - 1, -beta, -alpha, -turn_multiplier,
+                                      ply + 1, on_pv and move == hash_move)
+            else:
+                reduction = 0
+                if searched > LMR_FULL_DEPTH_MOVES and depth >= LMR_MIN_DEPTH and not in_check and \
+                        not move & TACTICAL << 12 and move not in killers and not game_state.inCheck():
+                    reduction = LMR_REDUCTION + (searched > LMR_DEEP_MOVES)
+                score = -self.negamax(game_state, None, depth - 1 - reduction, -alpha - NULL_WINDOW, -alpha,
+                                      -turn_multiplier, ply + 1)
+                if reduction and score > alpha and not self.stopped:
+                    score = -self.negamax(game_state, None, depth - 1, -alpha - NULL_WINDOW, -alpha,
+                                          -turn_multiplier, ply + 1)
+                if alpha < score < beta and not self.stopped:
+                    score = -self.negamax(game_state, None, depth - 1, -beta, -alpha, -turn_multiplier, ply + 1)
+            game_state.undoMoveCode()
+            if self.stopped:
+                return 0
+            if score > max_score or not best_move:
+                max_score = score
+                best_move = move
+                pv_table[ply] = [move] + pv_table[ply + 1]
+            if max_score > alpha:
+                alpha = max_score
+            if alpha >= beta:
+                if not move & TACTICAL << 12:
+                    self.recordCutoff(move, depth, ply)
+                break
+
+        if not best_move:
+            max_score = -CHECKMATE if game_state.inCheck() else STALEMATE
+            self.transposition_table.store(key, NO_MOVE, depth, EXACT, max_score)
+            return max_score
+        if max_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif max_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.transposition_table.store(key, best_move, depth, bound, max_score)
+        return max_score
+
+    def quiescence(self, game_state, alpha, beta, turn_multiplier):
+        """
+        Search captures and promotions only until the position is quiet, so the evaluation is never taken
+        in the middle of an exchange. The side to move may also stand pat on the static score. Captures
+        that cannot reach alpha (delta pruning) or lose material on the exchange (SEE) are skipped.
+        """
+        self.nodes_searched += 1
+        if self.nodes_searched % TIME_CHECK_INTERVAL == 0:
+            self.checkLimits()
+        if self.stopped:
+            return 0
+        max_score = turn_multiplier * scoreBoard(game_state, self.evaluation_cache, self.pawn_hash_table)
+        if max_score >= beta:
+            return max_score
+        alpha = max(alpha, max_score)
+        board = game_state.board
+        for move in game_state.iterMoves(stage=STAGE_CAPTURES, legal=False):
+            if not move & PROMOTION << 12:
+                victim = EXCHANGE_VALUES[board[move >> 9 & 7][move >> 6 & 7][1]]
+                if max_score + victim + DELTA_MARGIN <= alpha:
+                    continue
+                if EXCHANGE_VALUES[board[move >> 3 & 7][move & 7][1]] > victim and \
+                        game_state.staticExchange(move) < 0:
+                    continue
+            game_state.makeMoveCode(move)
+            if game_state.moveLeftKingInCheck():
+                game_state.undoMoveCode()
+                continue
+            score = -self.quiescence(game_state, -beta, -alpha, -turn_multiplier)
+            game_state.undoMoveCode()
+            if self.stopped:
+                return 0
+            if score > max_score:
+                max_score = score
+                if score >= beta:
+                    break
+                alpha = max(alpha, score)
+        return max_score
+
+
+def findBestMove(game_state, valid_moves, return_queue, limits=None, searcher=None, workers=1, stop_event=None):
+    """
+    Entry point for the AI process: search with searcher (or a RootSplitSearcher to split the root moves
+    over its worker pool) and put the chosen Move from valid_moves on return_queue, or None if there is
+    none. Without a searcher a fresh Searcher is made for this move; callers that want the transposition
+    table to last from move to move keep their own Searcher, as PonderingEngine does.
+    With more than one worker the search runs as lazy SMP over that many processes.
+    Setting stop_event (a multiprocessing.Event) ends the fresh Searcher's or the lazy SMP search early,
+    with the best move found so far; unlike terminating the process, that lets the helpers shut down.
+    A searcher passed in is stopped by the stop_event it was made with.
+    """
+    root_moves = [move.code for move in valid_moves]
+    if workers > 1:
+        result = lazySMPSearch(game_state, limits, root_moves, workers, searcher, stop_event)
+    else:
+        result = (searcher or Searcher(stop_event=stop_event)).search(game_state, limits, root_moves)
+    return_queue.put(next((move for move in valid_moves if move.code == result.best_move), None))
+
+
+def lazySMPSearch(game_state, limits=None, root_moves=None, workers=2, searcher=None, stop_event=None):
+    """
+    Search with several processes at once that share one transposition table in shared memory, so
+    each finds what the others stored. The main search runs here, with searcher (whose table must be
+    shared; a fresh one by default); workers - 1 helper processes search the same root with every other
+    helper a ply deeper per iteration and a differently seeded move order. Once the main search ends,
+    however it ends, the helpers are stopped and joined and a table created here is freed. Setting
+    stop_event ends the main search early. Returns the SearchResult with the deepest completed iteration
+    (the main search's on a tie), counting the nodes and evaluation cache statistics of all processes.
+    """
+    own_searcher = searcher is None
+    searcher = searcher or Searcher(shared_table=True)
+    table = searcher.transposition_table
+    if not table.shared:
+        raise ValueError("lazy SMP needs a Searcher with a shared transposition table")
+    if root_moves is None:
+        root_moves = list(game_state.getValidMoveCodes())
+    stop_helpers = Event()
+    result_queue = Queue()
+    helpers = [Process(target=lazySMPHelper, daemon=True,
+                       args=(game_state, limits, root_moves, table.shared_memory.name, table.size, table.age,
+                             stop_helpers, helper, result_queue))
+               for helper in range(1, workers)]
+    searcher_stop_event = searcher.stop_event
+    if stop_event is not None:
+        searcher.stop_event = stop_event
+    try:
+        for helper in helpers:
+            helper.start()
+        results = [searcher.search(game_state, limits, root_moves)]
+    finally:
+        searcher.stop_event = searcher_stop_event
+        stop_helpers.set()
+        started = [helper for helper in helpers if helper.pid is not None]
+        helper_results = collectHelperResults(result_queue, started)
+        for helper in started:
+            helper.join()
+        if own_searcher:
+            table.close()
+    results += helper_results
+    best = max(results, key=lambda result: result.depth)
+    best.nodes = sum(result.nodes for result in results)
+    best.eval_cache_hits = sum(result.eval_cache_hits for result in results)
+    best.eval_cache_misses = sum(result.eval_cache_misses for result in results)
+    return best
+
+
+def collectHelperResults(result_queue, helpers):
+    """
+    Take the SearchResults of the lazy SMP helpers off result_queue. A helper that died without putting
+    one is given up on once no helper is alive any more, instead of waiting for it forever.
+    """
+    results = []
+    while len(results) < len(helpers):
+        # Checked before waiting: whatever dead helpers put is already on the queue
+        all_exited = not any(helper.is_alive() for helper in helpers)
+        try:
+            results.append(result_queue.get(timeout=HELPER_POLL_INTERVAL))
+        except queue.Empty:
+            if all_exited:
+                break
+    return results
+
+
+def lazySMPHelper(game_state, limits, root_moves, table_name, table_size, table_age, stop_event, helper,
+                  result_queue):
+    """
+    Body of a lazy SMP helper process: search on the shared table until done or stopped and put the
+    SearchResult on result_queue.
+    """
+    table = TranspositionTable.attach(table_name, table_size, table_age)
+    searcher = Searcher(transposition_table=table, stop_event=stop_event, depth_offset=helper % 2)
+    rng = random.Random(helper)
+    for index in range(len(searcher.history_table)):
+        searcher.history_table[index] = rng.randrange(HISTORY_JITTER)
+    result = searcher.search(game_state, limits, root_moves)
+    table.close()
+    result_queue.put(result)
+
+
+class RootSplitSearcher:
+    """
+    Parallel search that splits the root moves over a pool of long-lived worker processes. Each
+    iteration first searches the first root move alone to set alpha (young brothers wait), then hands
+    the other moves out to the workers with that bound. Every move is searched by a fresh Searcher and
+    results are taken in move order, so a search limited by depth (or nodes) is reproducible whatever
+    the number of workers or their timing. When a move turns out to mate, the moves still waiting
+    are cancelled and the running ones stopped. Has the same search method as Searcher; call close
+    when done with it.
+    """
+
+    def __init__(self, workers=2):
+        self.stop_event = Event()
+        self.executor = ProcessPoolExecutor(workers, initializer=initRootWorker, initargs=(self.stop_event,))
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def search(self, game_state, limits=None, root_moves=None):
+        """
+        Search game_state with iterative deepening and return a SearchResult for the last completed
+        iteration, like Searcher.search. nodes and the evaluation cache statistics count all the workers.
+        The node limit applies to the total over all the workers: an iteration that goes past it is dropped.
+        The first iteration ignores the time and node limits, so there is always a move to play.
+        """
+        limits = limits or SearchLimits()
+        start_time = time.perf_counter()
+        budget = limits.timeBudget()
+        deadline = start_time + budget if budget is not None else None
+        root_moves = list(game_state.getValidMoveCodes() if root_moves is None else root_moves)
+        result = SearchResult()
+        nodes = cache_hits = cache_misses = 0
+        for depth in range(1, limits.depth + 1):
+            if not root_moves:
+                break
+            iteration_deadline = deadline if depth > 1 else None
+            node_budget = limits.nodes - nodes if limits.nodes is not None and depth > 1 else None
+            if node_budget is not None and node_budget <= 0:
+                break
+            # Young brothers wait: the first (best so far) move alone sets the bound for the others
+            outcomes = self.collect([self.submit(game_state, root_moves[0], depth, -CHECKMATE, iteration_deadline,
+                                                 node_budget)], iteration_deadline)
+            if None not in outcomes:  # Otherwise out of limits: the check below keeps the iteration before
+                alpha = outcomes[0][0]
+                if alpha < CHECKMATE:
+                    outcomes += self.collect([self.submit(game_state, move, depth, alpha, iteration_deadline,
+                                                          node_budget)
+                                              for move in root_moves[1:]], iteration_deadline)
+            for outcome in outcomes:
+                if outcome:
+                    nodes += outcome[2]
+                    cache_hits += outcome[3]
+                    cache_misses += outcome[4]
+            # Each move may use what is left of the node limit, so the iteration's total is checked as well
+            if not outcomes or None in outcomes or node_budget is not None and nodes > limits.nodes:
+                break  # Out of time or nodes: keep the result of the iteration before
+            best = max(range(len(outcomes)), key=lambda index: outcomes[index][0])  # First of equal scores
+            result = SearchResult(root_moves[best], outcomes[best][0], outcomes[best][1], depth)
+            # Search the next iteration best first, the others in order of their scores
+            order = sorted(range(len(outcomes)), key=lambda index: (index != best, -outcomes[index][0]))
+            root_moves = [root_moves[index] for index in order] + root_moves[len(outcomes):]
+            if abs(result.score) >= CHECKMATE:
+                break
+            if deadline is not None and time.perf_counter() - start_time > (deadline - start_time) / 2:
+                break
+        result.nodes = nodes
+        result.eval_cache_hits = cache_hits
+        result.eval_cache_misses = cache_misses
+        result.time = time.perf_counter() - start_time
+        return result
+
+    def submit(self, game_state, move, depth, alpha, deadline, nodes):
+        move_time = None if deadline is None else max(deadline - time.perf_counter(), 0) * 1000
+        return self.executor.submit(searchRootMove, game_state, move, depth, alpha,
+                                    SearchLimits(depth, move_time, nodes=nodes))
+
+    def collect(self, futures, deadline):
+        """
+        Wait for the outcomes of searchRootMove in submission order, up to deadline. Stops at the first
+        mate, cancelling the moves after it, or at the first that ran out of time or nodes, which is also
+        stopped. Returns the outcomes, ending with None if a limit was reached.
+        """
+        outcomes = []
+        for future in futures:
+            try:
+                outcome = future.result(None if deadline is None else max(deadline - time.perf_counter(), 0))
+            except TimeoutError:
+                outcome = None
+            outcomes.append(outcome)
+            if outcome is None or outcome[0] >= CHECKMATE:
+                break
+        if None in outcomes or len(outcomes) < len(futures):
+            self.stop_event.set()
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            self.stop_event.clear()
+        return outcomes
+
+
+def initRootWorker(stop_event):
+    global root_worker_stop_event
+    root_worker_stop_event = stop_event
+
+
+def searchRootMove(game_state, move, depth, alpha, limits):
+    """
+    Task of a RootSplitSearcher worker: score the root move to depth with a fresh Searcher, iteratively
+    deepening below it. Unless alpha is -CHECKMATE the move is first only tested against alpha, and
+    searched with an open window only if it beats it. Returns (score, principal variation, nodes,
+    evaluation cache hits, evaluation cache misses), or None if the search was stopped. The score is
+    from the point of view of the side to move at the root.
+    """
+    searcher = Searcher(ROOT_SPLIT_TABLE_MB, stop_event=root_worker_stop_event)
+    searcher.startSearch(limits, time.perf_counter())
+    game_state.makeMoveCode(move)
+    turn_multiplier = 1 if game_state.white_to_move else -1
+    for iteration in range(1, depth - 1):
+        searcher.negamax(game_state, None, iteration, -CHECKMATE, CHECKMATE, turn_multiplier, 1)
+    if alpha > -CHECKMATE:
+        score = -searcher.negamax(game_state, None, depth - 1, -alpha - NULL_WINDOW, -alpha, turn_multiplier, 1)
+    if alpha == -CHECKMATE or score > alpha:
+        score = -searcher.negamax(game_state, None, depth - 1, -CHECKMATE, -alpha, turn_multiplier, 1)
+    game_state.undoMoveCode()
+    if searcher.stopped:
+        return None
+    cache = searcher.evaluation_cache
+    return score, [move] + searcher.pv_table[1], searcher.nodes_searched, cache.hits, cache.misses
+
+
+class PonderingEngine:
+    """
+    The AI in one process for the whole game, so its transposition table carries over from move to move,
+    that can ponder: after it moves, it searches its next move assuming the opponent plays the reply its
+    principal variation expects. If the opponent does (a ponder-hit), that search simply goes on under the
+    real limits, keeping the depth it reached; otherwise it is dropped and a normal search started.
+    Searches run in the background: start one with go and check for its result with poll.
+    It searches with a single Searcher, not lazySMPSearch, so it uses one core whatever the machine has.
+    A ponder search only ends on go or stop: call stop when the game ends while pondering.
+    """
+
+    def __init__(self):
+        self.commands = Queue()
+        self.results = Queue()
+        self.process = Process(target=runEngine, args=(self.commands, self.results), daemon=True)
+        self.process.start()
+        self.search_id = 0  # Results of older searches are ignored
+        self.ponder_move = NO_MOVE  # The expected reply being pondered on
+        self.last_result = None
+
+    def go(self, game_state, valid_moves, limits):
+        """
+        Start the search for the move to play in game_state, unless the ponder search already covers it.
+        """
+        if self.ponder_move and len(game_state.move_log) and game_state.move_log.peek()[0] == self.ponder_move:
+            self.commands.put(("ponderhit", self.search_id))
+        else:
+            self.search_id += 1
+            self.commands.put(("go", self.search_id, game_state, [move.code for move in valid_moves], limits))
+        self.ponder_move = NO_MOVE
+
+    def ponder(self, game_state, valid_moves, limits):
+        """
+        After the engine's own move was made on game_state, start pondering on the opponent's expected
+        reply, if the last search expected one that is among valid_moves. limits apply after a ponder-hit.
+        """
+        pv = self.last_result.pv if self.last_result is not None else []
+        if len(pv) < 2 or not len(game_state.move_log) or game_state.move_log.peek()[0] != pv[0] or \
+                pv[1] not in [move.code for move in valid_moves]:
+            return
+        self.search_id += 1
+        self.ponder_move = pv[1]
+        self.commands.put(("ponder", self.search_id, game_state, pv[1], limits))
+
+    def poll(self):
+        """
+        The SearchResult of the current search once it is done, otherwise None.
+        """
+        while True:
+            try:
+                search_id, result = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if search_id == self.search_id:
+                self.last_result = result
+                return result
+
+    def stop(self):
+        """
+        Abandon the running search or ponder search, e.g. when a move is taken back.
+        """
+        self.search_id += 1
+        self.ponder_move = NO_MOVE
+        self.commands.put(("stop",))
+
+    def newGame(self):
+        self.stop()
+        self.last_result = None
+        self.commands.put(("newgame",))
+
+    def close(self):
+        self.commands.put(("quit",))
+        self.process.join()
+
+
+def runEngine(commands, results):
+    """
+    Body of the PonderingEngine process. Searches run in a thread, so stop and ponderhit commands
+    are read while they are going on; every command but ponderhit first ends the running search.
+    """
+    stop_event = threading.Event()
+    searcher = Searcher(stop_event=stop_event)
+    search_thread = None
+    ponder_id = None
+    ponder_hit = decided = threading.Event()
+    while True:
+        command = commands.get()
+        if command[0] == "ponderhit":
+            if command[1] == ponder_id:
+                ponder_hit.set()
+                decided.set()
+            continue
+        if search_thread is not None:
+            stop_event.set()
+            decided.set()
+            search_thread.join()
+            stop_event.clear()
+            search_thread = ponder_id = None
+        if command[0] == "quit":
+            return
+        if command[0] == "newgame":
+            searcher.newGame()
+        elif command[0] == "go":
+            search_id, game_state, root_moves, limits = command[1:]
+            search_thread = threading.Thread(target=reportSearch,
+                                             args=(searcher, game_state, limits, root_moves, search_id, results))
+            search_thread.start()
+        elif command[0] == "ponder":
+            ponder_id, game_state, move, limits = command[1:]
+            game_state.makeMoveCode(move)
+            ponder_hit = threading.Event()
+            decided = threading.Event()  # Set on a ponder-hit or when the ponder search is dropped
+            search_thread = threading.Thread(target=ponderSearch,
+                                             args=(searcher, game_state, limits, ponder_id, ponder_hit, decided,
+                                                   results))
+            search_thread.start()
+
+
+def reportSearch(searcher, game_state, limits, root_moves, search_id, results):
+    results.put((search_id, searcher.search(game_state, limits, root_moves)))
+
+
+def ponderSearch(searcher, game_state, limits, search_id, ponder_hit, decided, results):
+    """
+    Ponder until the opponent's move is known; only a ponder-hit delivers the result.
+    """
+    result = searcher.search(game_state, limits, ponder_hit=ponder_hit)
+    decided.wait()
+    if ponder_hit.is_set():
+        results.put((search_id, result))
+
+
+def scoreBoard(game_state, evaluation_cache=None, pawn_hash_table=None):
     """
     Score the board. A positive score is good for white, a negative score is good for black.
+    Unless the game is over this is staticScore, looked up in evaluation_cache when one is given.
     """
     if game_state.checkmate:
         if game_state.white_to_move:
@@ -108,22 +809,26 @@ def scoreBoard(game_state):
             return CHECKMATE  # white wins
     elif game_state.stalemate:
         return STALEMATE
-    score = 0
-    for row in range(len(game_state.board)):
-        for col in range(len(game_state.board[row])):
-            piece = game_state.board[row][col]
-            if piece != "--":
-                piece_position_score = 0
-                if piece[1] != "K":
-                    piece_position_score = piece_position_scores[piece][row][col]
-                if piece[0] == "w":
-                    score += piece_score[piece[1]] + piece_position_score
-                if piece[0] == "b":
-                    score -= piece_score[piece[1]] + piece_position_score
-
+    if evaluation_cache is None:
+        return staticScore(game_state, pawn_hash_table)
+    key = game_state.zobrist_key
+    score = evaluation_cache.probe(key)
+    if score is None:
+        score = staticScore(game_state, pawn_hash_table)
+        evaluation_cache.store(key, score)
     return score
 
 
+def staticScore(game_state, pawn_hash_table=None):
+    """
+    Score of the pieces on the board, for white. The packed middlegame/endgame totals in game_state.scores
+    and the game phase are kept up to date move by move and the pawn structure is looked up in
+    pawn_hash_table (see PawnStructure.pawnScore); here they are only blended once.
+    """
+    scores = game_state.scores
+    return taperedScore(scores["w"] - scores["b"] + pawnScore(game_state, pawn_hash_table), game_state.phase) / 100
+
+
 def findRandomMove(valid_moves):
     """
     Picks and returns a random valid move.
@@ -1,3 +1,117 @@
+import random
+from array import array
+
+from Evaluation import PHASE_WEIGHTS, SQUARE_SCORES
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+PROMOTION_PIECES = ("Q", "R", "B", "N")  # Queen first, so it is the default choice
+
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+DIRECTIONS = [(-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]  # Orthogonal, then diagonal
+SQUARE_COORDS = [(square // 8, square % 8) for square in range(64)]
+
+# Packed moves: bits 0-5 start square, bits 6-11 end square (both row * 8 + col), bits 12-15 flags.
+# The search and the generators pass these around in array("H") buffers; Move is only built for callers
+# that need one. Code 0 (a8 to a8) is never a legal move, so it can stand for "no move".
+QUIET, DOUBLE_PAWN_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, ENPASSANT_CAPTURE = 0, 1, 2, 3, 4, 5
+PROMOTION = 8  # Plus the PROMOTION_PIECES index of the new piece, plus CAPTURE if it takes something
+TACTICAL = CAPTURE | PROMOTION  # Flags of the moves in the capture stage: captures and promotions
+NO_MOVE = 0
+
+# Stages of GameState.iterMoves, in the order they are searched
+STAGE_HASH_MOVE, STAGE_CAPTURES, STAGE_KILLERS, STAGE_QUIETS = range(4)
+# Rough piece values for ordering captures (MVV-LVA); "-" is the empty target of an en passant capture
+CAPTURE_ORDER_VALUES = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 10, "-": 1}
+# The same for static exchange evaluation, where losing the king must outweigh any material
+EXCHANGE_VALUES = dict(CAPTURE_ORDER_VALUES, K=100)
+
+
+def packMove(start_square, end_square, flags=QUIET):
+    """
+    Packs a move into 16 bits.
+    """
+    return start_square | end_square << 6 | flags << 12
+
+
+def _jumpSquares(offsets):
+    """
+    For each square (index row * 8 + col), the on-board squares one jump away.
+    """
+    return [[(row + d_row, col + d_col) for d_row, d_col in offsets
+             if 0 <= row + d_row < 8 and 0 <= col + d_col < 8]
+            for row in range(8) for col in range(8)]
+
+
+def _raySquares():
+    """
+    For each square, the squares along each of the 8 DIRECTIONS, nearest first.
+    """
+    rays = []
+    for row in range(8):
+        for col in range(8):
+            rays.append([[(row + d_row * i, col + d_col * i) for i in range(1, 8)
+                          if 0 <= row + d_row * i < 8 and 0 <= col + d_col * i < 8]
+                         for d_row, d_col in DIRECTIONS])
+    return rays
+
+
+KNIGHT_SQUARES = _jumpSquares(KNIGHT_OFFSETS)
+KING_SQUARES = _jumpSquares(KING_OFFSETS)
+RAY_SQUARES = _raySquares()
+ALL_SQUARES = (1 << 64) - 1
+
+
+def _lineTables():
+    """
+    Build BETWEEN[a][b] (bitmap of the squares strictly between two aligned squares) and
+    LINE[a][b] (the whole line through both squares, edge to edge). Both are 0 for unaligned squares.
+    """
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for square in range(64):
+        for direction, (d_row, d_col) in enumerate(DIRECTIONS):
+            opposite = RAY_SQUARES[square][DIRECTIONS.index((-d_row, -d_col))]
+            full_line = 1 << square
+            for row, col in RAY_SQUARES[square][direction] + opposite:
+                full_line |= 1 << (row * 8 + col)
+            path = 0
+            for row, col in RAY_SQUARES[square][direction]:
+                target = row * 8 + col
+                between[square][target] = path
+                line[square][target] = full_line
+                path |= 1 << target
+    return between, line
+
+
+BETWEEN, LINE = _lineTables()
+
+
+def _zobristKeys():
+    """
+    Random 64-bit keys for Zobrist hashing. The generator is seeded, so every process
+    (including the AI worker processes) agrees on the keys.
+    """
+    rng = random.Random(0x5EED)
+    pieces = {color + piece_type: [rng.getrandbits(64) for _ in range(64)]
+              for color in "wb" for piece_type in "pRNBQK"}
+    rights = [rng.getrandbits(64) for _ in range(4)]  # wks, bks, wqs, bqs
+    # One combined key per set of castling rights, indexed by CastleRights.getIndex()
+    castling = []
+    for index in range(16):
+        key = 0
+        for bit in range(4):
+            if index >> bit & 1:
+                key ^= rights[bit]
+        castling.append(key)
+    enpassant = [rng.getrandbits(64) for _ in range(8)]  # By file of the en passant square
+    black_to_move = rng.getrandbits(64)
+    return pieces, castling, enpassant, black_to_move
+
+
+ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_ENPASSANT, ZOBRIST_BLACK_TO_MOVE = _zobristKeys()
+
+
 class GameState:
     def __init__(self):
         """
@@ -31,17 +145,18 @@ class GameState:
 
         # Game status variables
         self.white_to_move = True  # White moves first
-        self.move_log = []  # Track all the moves
+        self.move_log = MoveLog()  # Track all the moves
         self.white_king_location = (7, 4)  # White king starting position
         self.black_king_location = (0, 4)  # Black king starting position
         self.checkmate = False  # Checkmate flag
         self.stalemate = False  # Stalemate flag
         self.in_check = False  # Is the current player in check?
-        self.pins = []  # Pieces pinned to the king
-        self.checks = []  # Pieces checking the king
+        self.pinned = 0  # Bitmap (bit row * 8 + col) of the pieces pinned to the king
+        self.check_mask = ALL_SQUARES  # Squares a piece other than the king may move to while in check
+        self.pseudo_legal = False  # Generators skip king safety tests (see getPseudoLegalMoveCodes)
+        self.captures_only = False  # Generators skip quiet moves other than promotions (see iterMoves)
         self.enpassant_possible = ()  # Track en passant possibilities
         self.enpassant_possible_log = [self.enpassant_possible]  # Log en passant history
-        self.position_count = {}  # Tracks occurrences of board positions
         self.threefold_repetition = False  # Track if threefold repetition occurs
 
         # Track castling rights and history
@@ -51,205 +166,378 @@ class GameState:
                                                self.current_castling_rights.wqs,
                                                self.current_castling_rights.bqs)]
 
+        # Zobrist key of the current position, updated incrementally by makeMove/undoMove
+        self.zobrist_key = self.computeZobristKey()
+        self.zobrist_log = []  # Keys of the earlier positions, for undo
+        self.position_count = {self.zobrist_key: 1}  # Tracks occurrences of board positions by key
+        self.pawn_key = self.computePawnKey()  # Zobrist key of the pawns alone (see PawnStructure)
+
+        # Packed middlegame/endgame score of each side and the game phase (see Evaluation), updated by makeMove/undoMove
+        self.scores = self.computeScores()
+        self.phase = self.computePhase()
+
+    def loadFEN(self, fen):
+        """
+        Set up the position described by a FEN string and clear the move history.
+        The half-move and full-move counters are accepted but not tracked.
+        """
+        fields = fen.split()
+        placement, side, castling = fields[0], fields[1], fields[2]
+        enpassant = fields[3] if len(fields) > 3 else "-"
+
+        self.board = []
+        for row, rank in enumerate(placement.split("/")):
+            board_row = []
+            for char in rank:
+                if char.isdigit():
+                    board_row.extend(["--"] * int(char))
+                else:
+                    piece = ("w" if char.isupper() else "b") + (char.upper() if char.lower() != "p" else "p")
+                    if piece == "wK":
+                        self.white_king_location = (row, len(board_row))
+                    elif piece == "bK":
+                        self.black_king_location = (row, len(board_row))
+                    board_row.append(piece)
+            self.board.append(board_row)
+
+        self.white_to_move = side == "w"
+        self.move_log = MoveLog()
+        self.checkmate = False
+        self.stalemate = False
+        self.in_check = False
+        self.pinned = 0
+        self.check_mask = ALL_SQUARES
+        if enpassant == "-":
+            self.enpassant_possible = ()
+        else:
+            self.enpassant_possible = (Move.ranks_to_rows[enpassant[1]], Move.files_to_cols[enpassant[0]])
+        self.enpassant_possible_log = [self.enpassant_possible]
+        self.threefold_repetition = False
+        self.current_castling_rights = CastleRights("K" in castling, "k" in castling, "Q" in castling, "q" in castling)
+        self.castle_rights_log = [CastleRights(self.current_castling_rights.wks,
+                                               self.current_castling_rights.bks,
+                                               self.current_castling_rights.wqs,
+                                               self.current_castling_rights.bqs)]
+        self.zobrist_key = self.computeZobristKey()
+        self.zobrist_log = []
+        self.position_count = {self.zobrist_key: 1}
+        self.pawn_key = self.computePawnKey()
+        self.scores = self.computeScores()
+        self.phase = self.computePhase()
+
     def makeMove(self, move):
         """
         Makes a move on the board and updates the game state.
         """
-        # Move piece from start to end position
-        self.board[move.start_row][move.start_col] = "--"  # Clear start position
-        self.board[move.end_row][move.end_col] = move.piece_moved  # Place piece at destination
+        self.makeMoveCode(move.code)
+
+    def makeMoveCode(self, code):
+        """
+        Makes a packed move (see packMove) on the board and updates the game state.
+        makeMove goes through here; the search calls it directly so no Move has to be built.
+        """
+        start = code & 63
+        end = code >> 6 & 63
+        flags = code >> 12
+        start_row, start_col = SQUARE_COORDS[start]
+        end_row, end_col = SQUARE_COORDS[end]
+        board = self.board
+        piece_moved = board[start_row][start_col]
+
+        # Take the old castling and en passant keys out of the hash before they change
+        self.zobrist_log.append(self.zobrist_key)
+        key = self.zobrist_key ^ ZOBRIST_CASTLING[self.current_castling_rights.getIndex()]
+        if self.enpassant_possible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
+
+        # Handle en passant captures: the captured pawn is beside the start square, not on the end square
+        if flags == ENPASSANT_CAPTURE:
+            captured_square = start_row * 8 + end_col
+            piece_captured = board[start_row][end_col]
+            board[start_row][end_col] = "--"
+        else:
+            captured_square = end
+            piece_captured = board[end_row][end_col]
+
+        # Move piece from start to end position, promoting it if the move says so
+        piece_placed = piece_moved[0] + PROMOTION_PIECES[flags & 3] if flags & PROMOTION else piece_moved
+        board[start_row][start_col] = "--"  # Clear start position
+        board[end_row][end_col] = piece_placed  # Place piece at destination
 
         # Log the move for undo purposes
-        self.move_log.append(move)
+        self.move_log.push(code, piece_moved, piece_captured)
 
         # Switch turns after every move
         self.white_to_move = not self.white_to_move
 
         # Update king's location if it moved
-        if move.piece_moved == "wK":
-            self.white_king_location = (move.end_row, move.end_col)
-        elif move.piece_moved == "bK":
-            self.black_king_location = (move.end_row, move.end_col)
-
-        # Handle pawn promotion (default to queen)
-        if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + "Q"
-
-        # Handle en passant captures
-        if move.is_enpassant_move:
-            if move.piece_moved == "wp":  # White captures black pawn
-                self.board[move.end_row + 1][move.end_col] = "--"
-            else:  # Black captures white pawn
-                self.board[move.end_row - 1][move.end_col] = "--"
+        if piece_moved == "wK":
+            self.white_king_location = (end_row, end_col)
+        elif piece_moved == "bK":
+            self.black_king_location = (end_row, end_col)
 
         # Update en passant possibilities for next turn
-        if move.piece_moved[1] == "p" and abs(move.start_row - move.end_row) == 2:  # Pawn moves two squares
-            self.enpassant_possible = ((move.start_row + move.end_row) // 2, move.start_col)
+        if flags == DOUBLE_PAWN_PUSH:
+            self.enpassant_possible = ((start_row + end_row) // 2, start_col)
         else:
             self.enpassant_possible = ()
 
         # Handle castling moves
-        if move.is_castle_move:
-            if move.end_col - move.start_col == 2:  # King-side castling
-                self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][move.end_col + 1]
-                self.board[move.end_row][move.end_col + 1] = "--"
-            else:  # Queen-side castling
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 2]
-                self.board[move.end_row][move.end_col - 2] = "--"
+        if flags == KING_CASTLE:
+            board[end_row][end_col - 1] = board[end_row][end_col + 1]
+            board[end_row][end_col + 1] = "--"
+        elif flags == QUEEN_CASTLE:
+            board[end_row][end_col + 1] = board[end_row][end_col - 2]
+            board[end_row][end_col - 2] = "--"
 
         # Log en passant status for undo purposes
         self.enpassant_possible_log.append(self.enpassant_possible)
 
         # Update castling rights after the move (rooks/kings can affect this)
-        self.updateCastleRights(move)
+        self.updateCastleRights(piece_moved, piece_captured, start, end)
         self.castle_rights_log.append(CastleRights(self.current_castling_rights.wks,
                                                    self.current_castling_rights.bks,
                                                    self.current_castling_rights.wqs,
                                                    self.current_castling_rights.bqs))
-        board_hash = self.getBoardHash()
-        if board_hash in self.position_count:
-            self.position_count[board_hash] += 1
-        else:
-            self.position_count[board_hash] = 1
+
+        # Update the Zobrist key, the scores and the phase: moved piece, captured piece, castling rook, rights,
+        # en passant, side
+        scores = self.scores
+        color = piece_moved[0]
+        key ^= ZOBRIST_PIECES[piece_moved][start] ^ ZOBRIST_PIECES[piece_placed][end]
+        scores[color] += SQUARE_SCORES[piece_placed][end] - SQUARE_SCORES[piece_moved][start]
+        if flags & PROMOTION:
+            self.phase += PHASE_WEIGHTS[piece_placed[1]]
+        if piece_moved[1] == "p":
+            self.pawn_key ^= ZOBRIST_PIECES[piece_moved][start]
+            if piece_placed is piece_moved:  # Still a pawn, not promoted
+                self.pawn_key ^= ZOBRIST_PIECES[piece_moved][end]
+        if piece_captured != "--":
+            key ^= ZOBRIST_PIECES[piece_captured][captured_square]
+            scores[piece_captured[0]] -= SQUARE_SCORES[piece_captured][captured_square]
+            self.phase -= PHASE_WEIGHTS[piece_captured[1]]
+            if piece_captured[1] == "p":
+                self.pawn_key ^= ZOBRIST_PIECES[piece_captured][captured_square]
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rook = color + "R"
+            rook_keys = ZOBRIST_PIECES[rook]
+            row_start = end & 56
+            if flags == KING_CASTLE:  # King-side rook h -> f
+                rook_from, rook_to = row_start + 7, row_start + 5
+            else:  # Queen-side rook a -> d
+                rook_from, rook_to = row_start, row_start + 3
+            key ^= rook_keys[rook_from] ^ rook_keys[rook_to]
+            scores[color] += SQUARE_SCORES[rook][rook_to] - SQUARE_SCORES[rook][rook_from]
+        key ^= ZOBRIST_CASTLING[self.current_castling_rights.getIndex()] ^ ZOBRIST_BLACK_TO_MOVE
+        if self.enpassant_possible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
+        self.zobrist_key = key
+
+        count = self.position_count.get(key, 0) + 1
+        self.position_count[key] = count
 
         # Check for threefold repetition
-        if self.position_count[board_hash] == 3:
+        if count == 3:
             self.threefold_repetition = True  # Declare draw by threefold repetition
 
     def undoMove(self):
         """
         Reverts the last move and restores the previous game state.
         """
+        self.undoMoveCode()
+
+    def undoMoveCode(self):
+        """
+        Reverts the last move made with makeMove or makeMoveCode.
+        """
         if len(self.move_log) != 0:
-            move = self.move_log.pop()
+            code, piece_moved, piece_captured = self.move_log.pop()
+            start = code & 63
+            end = code >> 6 & 63
+            flags = code >> 12
+            start_row, start_col = SQUARE_COORDS[start]
+            end_row, end_col = SQUARE_COORDS[end]
+            board = self.board
             # Restore the original positions
-            self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
+            board[start_row][start_col] = piece_moved
+            if flags == ENPASSANT_CAPTURE:  # Undo en passant
+                board[end_row][end_col] = "--"
+                board[start_row][end_col] = piece_captured
+            else:
+                board[end_row][end_col] = piece_captured
             self.white_to_move = not self.white_to_move  # Switch turns back
 
             # Update king's position if necessary
-            if move.piece_moved == "wK":
-                self.white_king_location = (move.start_row, move.start_col)
-            elif move.piece_moved == "bK":
-                self.black_king_location = (move.start_row, move.start_col)
-
-            # Undo en passant
-            if move.is_enpassant_move:
-                self.board[move.end_row][move.end_col] = "--"
-                self.board[move.start_row][move.end_col] = move.piece_captured
+            if piece_moved == "wK":
+                self.white_king_location = (start_row, start_col)
+            elif piece_moved == "bK":
+                self.black_king_location = (start_row, start_col)
 
             # Undo en passant possibility
             self.enpassant_possible_log.pop()
             self.enpassant_possible = self.enpassant_possible_log[-1]
 
-            # Undo castling rights
+            # Undo castling rights (copy, so updateCastleRights never edits the log entry in place)
             self.castle_rights_log.pop()
-            self.current_castling_rights = self.castle_rights_log[-1]
+            castle_rights = self.castle_rights_log[-1]
+            self.current_castling_rights = CastleRights(castle_rights.wks, castle_rights.bks,
+                                                        castle_rights.wqs, castle_rights.bqs)
 
             # Undo castling moves
-            if move.is_castle_move:
-                if move.end_col - move.start_col == 2:  # Undo king-side castling
-                    self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 1]
-                    self.board[move.end_row][move.end_col - 1] = "--"
-                else:  # Undo queen-side castling
-                    self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
-                    self.board[move.end_row][move.end_col + 1] = "--"
+            color = piece_moved[0]
+            scores = self.scores
+            if flags == KING_CASTLE:
+                board[end_row][end_col + 1] = board[end_row][end_col - 1]
+                board[end_row][end_col - 1] = "--"
+                scores[color] += SQUARE_SCORES[color + "R"][end + 1] - SQUARE_SCORES[color + "R"][end - 1]
+            elif flags == QUEEN_CASTLE:
+                board[end_row][end_col - 2] = board[end_row][end_col + 1]
+                board[end_row][end_col + 1] = "--"
+                scores[color] += SQUARE_SCORES[color + "R"][end - 2] - SQUARE_SCORES[color + "R"][end + 1]
+
+            # Take the move back out of the scores, the phase and the pawn key
+            if flags & PROMOTION:
+                piece_placed = color + PROMOTION_PIECES[flags & 3]
+                self.phase -= PHASE_WEIGHTS[piece_placed[1]]
+                self.pawn_key ^= ZOBRIST_PIECES[piece_moved][start]
+            else:
+                piece_placed = piece_moved
+                if piece_moved[1] == "p":
+                    self.pawn_key ^= ZOBRIST_PIECES[piece_moved][start] ^ ZOBRIST_PIECES[piece_moved][end]
+            scores[color] += SQUARE_SCORES[piece_moved][start] - SQUARE_SCORES[piece_placed][end]
+            if piece_captured != "--":
+                captured_square = start_row * 8 + end_col if flags == ENPASSANT_CAPTURE else end
+                scores[piece_captured[0]] += SQUARE_SCORES[piece_captured][captured_square]
+                self.phase += PHASE_WEIGHTS[piece_captured[1]]
+                if piece_captured[1] == "p":
+                    self.pawn_key ^= ZOBRIST_PIECES[piece_captured][captured_square]
             self.checkmate = False
             self.stalemate = False
-            board_hash = self.getBoardHash()
-            if board_hash in self.position_count:
-                self.position_count[board_hash] -= 1
 
-    def updateCastleRights(self, move):
+            # Forget the position being left and restore the previous key
+            count = self.position_count[self.zobrist_key] - 1
+            if count:
+                self.position_count[self.zobrist_key] = count
+            else:
+                del self.position_count[self.zobrist_key]
+            if count == 2:
+                self.threefold_repetition = False
+            self.zobrist_key = self.zobrist_log.pop()
+
+    def makeNullMove(self):
+        """
+        Pass the turn without moving, for null-move pruning in the search: switches the side to move and
+        clears en passant, keeping the Zobrist key in step. Undo it with undoNullMove before any other undo.
+        """
+        self.zobrist_log.append(self.zobrist_key)
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE
+        if self.enpassant_possible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
+        self.zobrist_key = key
+        self.enpassant_possible = ()
+        self.enpassant_possible_log.append(self.enpassant_possible)
+        self.white_to_move = not self.white_to_move
+
+    def undoNullMove(self):
+        """
+        Reverts makeNullMove.
+        """
+        self.white_to_move = not self.white_to_move
+        self.enpassant_possible_log.pop()
+        self.enpassant_possible = self.enpassant_possible_log[-1]
+        self.zobrist_key = self.zobrist_log.pop()
+
+    def hasNonPawnMaterial(self):
+        """
+        Whether the side to move has a piece besides its king and pawns. Without one zugzwang is common,
+        so the search does not try null moves.
+        """
+        color = "w" if self.white_to_move else "b"
+        return any(piece[0] == color and piece[1] not in "pK" for row in self.board for piece in row)
+
+    def updateCastleRights(self, piece_moved, piece_captured, start, end):
         """
         Updates castling rights after each move. If the rook or king moves, it affects castling rights.
+        start and end are the squares (row * 8 + col) the piece moved between.
         """
-        # If a white rook gets captured
-        if move.piece_captured == "wR":
-            if move.end_col == 0:
+        # If a white rook gets captured on its starting square
+        if piece_captured == "wR":
+            if end == 56:
                 self.current_castling_rights.wqs = False  # No more queen-side castling for white
-            elif move.end_col == 7:
+            elif end == 63:
                 self.current_castling_rights.wks = False  # No more king-side castling for white
 
-        # If a black rook gets captured
-        elif move.piece_captured == "bR":
-            if move.end_col == 0:
+        # If a black rook gets captured on its starting square
+        elif piece_captured == "bR":
+            if end == 0:
                 self.current_castling_rights.bqs = False  # No more queen-side castling for black
-            elif move.end_col == 7:
+            elif end == 7:
                 self.current_castling_rights.bks = False  # No more king-side castling for black
 
         # If white king moves, white loses both castling rights
-        if move.piece_moved == 'wK':
+        if piece_moved == 'wK':
             self.current_castling_rights.wks = False
             self.current_castling_rights.wqs = False
 
         # If black king moves, black loses both castling rights
-        elif move.piece_moved == 'bK':
+        elif piece_moved == 'bK':
             self.current_castling_rights.bks = False
             self.current_castling_rights.bqs = False
 
-        # If a white rook moves, check which one and update castling rights
-        elif move.piece_moved == 'wR':
-            if move.start_col == 0:
+        # If a white rook moves off its starting square, check which one and update castling rights
+        elif piece_moved == 'wR':
+            if start == 56:
                 self.current_castling_rights.wqs = False
-            elif move.start_col == 7:
+            elif start == 63:
                 self.current_castling_rights.wks = False
 
-        # If a black rook moves, check which one and update castling rights
-        elif move.piece_moved == 'bR':
-            if move.start_col == 0:
+        # If a black rook moves off its starting square, check which one and update castling rights
+        elif piece_moved == 'bR':
+            if start == 0:
                 self.current_castling_rights.bqs = False
-            elif move.start_col == 7:
+            elif start == 7:
                 self.current_castling_rights.bks = False
 
     def getValidMoves(self):
         """
         Returns all valid moves, taking checks into account.
         """
+        return [Move.fromCode(code, self.board) for code in self.getValidMoveCodes()]
+
+    def getValidMoveCodes(self, captures_only=False):
+        """
+        Returns all valid moves as packed codes in an array("H").
+        With captures_only, only the captures and promotions; checkmate and stalemate are then not flagged.
+        """
         temp_castle_rights = CastleRights(self.current_castling_rights.wks,
                                           self.current_castling_rights.bks,
                                           self.current_castling_rights.wqs,
                                           self.current_castling_rights.bqs)
 
-        moves = []
-        self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
+        moves = array("H")
+        # The generators read self.pinned and self.check_mask, so pins and check evasions cost one lookup
+        self.in_check, self.pinned, self.check_mask = self.checkForPinsAndChecks()
+        self.captures_only = captures_only
 
         # Get the king's position based on the current player's turn
         if self.white_to_move:
-            king_row = self.white_king_location[0]
-            king_col = self.white_king_location[1]
-        else:
-            king_row = self.black_king_location[0]
-            king_col = self.black_king_location[1]
-
-        if self.in_check:
-            if len(self.checks) == 1:
-                moves = self.getAllPossibleMoves()  # Get all possible moves
-                # Handle blocking or capturing the checking piece
-                check = self.checks[0]
-                valid_squares = []
-                if self.board[check[0]][check[1]][1] == "N":  # If a knight is checking, must capture
-                    valid_squares = [(check[0], check[1])]
-                else:
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2] * i, king_col + check[3] * i)
-                        valid_squares.append(valid_square)
-                        if valid_square == (check[0], check[1]):
-                            break
-                moves = [move for move in moves if
-                         move.piece_moved[1] == "K" or (move.end_row, move.end_col) in valid_squares]
-            else:
-                # If there are two checks, the king must move
-                self.getKingMoves(king_row, king_col, moves)
+            king_row, king_col = self.white_king_location
         else:
-            moves = self.getAllPossibleMoves()  # Get all moves when not in check
-            if self.white_to_move:
-                self.getCastleMoves(self.white_king_location[0], self.white_king_location[1], moves)
-            else:
-                self.getCastleMoves(self.black_king_location[0], self.black_king_location[1], moves)
+            king_row, king_col = self.black_king_location
 
-        if len(moves) == 0:
-            if self.inCheck():
+        if self.check_mask == 0:
+            # If there are two checks, the king must move
+            self.getKingMoves(king_row, king_col, moves)
+        else:
+            moves = self.getAllPossibleMoveCodes()
+            if not self.in_check and not captures_only:
+                self.getCastleMoves(king_row, king_col, moves)
+        self.pinned = 0
+        self.check_mask = ALL_SQUARES
+        self.captures_only = False
+
+        if len(moves) == 0 and not captures_only:
+            if self.in_check:
                 self.checkmate = True  # No valid moves and in check = checkmate
             else:
                 self.stalemate = True  # No valid moves and not in check = stalemate
@@ -257,6 +545,170 @@ class GameState:
         self.current_castling_rights = temp_castle_rights
         return moves
 
+    def getPseudoLegalMoveCodes(self, captures_only=False):
+        """
+        Returns the moves allowed by the piece rules as packed codes, without the pin, check and
+        king safety tests, so some of them may leave the own king in check. Make each move and call
+        moveLeftKingInCheck() to find out. Castling is still checked in full.
+        With captures_only, only the captures and promotions.
+        """
+        self.pseudo_legal = True
+        self.captures_only = captures_only
+        moves = self.getAllPossibleMoveCodes()
+        self.pseudo_legal = False
+        self.captures_only = False
+        if captures_only:
+            return moves
+        if self.white_to_move:
+            self.getCastleMoves(self.white_king_location[0], self.white_king_location[1], moves)
+        else:
+            self.getCastleMoves(self.black_king_location[0], self.black_king_location[1], moves)
+        return moves
+
+    def moveLeftKingInCheck(self):
+        """
+        After makeMoveCode, check whether the side that just moved left its own king attacked,
+        i.e. whether a pseudo-legal move was illegal.
+        """
+        if self.white_to_move:
+            return self.squareAttackedBy(self.black_king_location[0], self.black_king_location[1], "w")
+        return self.squareAttackedBy(self.white_king_location[0], self.white_king_location[1], "b")
+
+    def iterMoves(self, hash_move=NO_MOVE, killers=(), stage=STAGE_QUIETS, legal=True, history=None):
+        """
+        Yields the valid moves as packed codes in search order: the hash move, captures and promotions
+        (most valuable victim first, then least valuable attacker), the killer moves, then the quiet moves,
+        sorted by history[move & 4095] (from and to square) when a history table is given.
+        Only valid hash and killer moves are yielded, and no move twice. stage is the last stage to
+        go through, e.g. STAGE_CAPTURES for captures and promotions only.
+        With legal=False the moves are only pseudo-legal, as from getPseudoLegalMoveCodes.
+        Nothing is generated until the first move is asked for; the caller spots mate and stalemate
+        itself when nothing is yielded. The captures are generated on their own unless a hash move has to
+        be checked first, and the quiet moves only once the killer stage is reached.
+        """
+        moves = None
+        if hash_move:
+            moves = self.getValidMoveCodes() if legal else self.getPseudoLegalMoveCodes()
+            if hash_move in moves:
+                yield hash_move
+            else:
+                hash_move = NO_MOVE
+        if stage < STAGE_CAPTURES:
+            return
+        if moves is None:
+            tactical = self.getValidMoveCodes(captures_only=True) if legal \
+                else self.getPseudoLegalMoveCodes(captures_only=True)
+        else:
+            tactical = [move for move in moves if move & TACTICAL << 12]
+        for move in self.sortCaptures(tactical):
+            if move != hash_move:
+                yield move
+        if stage < STAGE_KILLERS:
+            return
+        if moves is None:
+            moves = self.getValidMoveCodes() if legal else self.getPseudoLegalMoveCodes()
+        played = [hash_move]
+        for killer in killers:
+            if killer not in played and not killer & TACTICAL << 12 and killer in moves:
+                played.append(killer)
+                yield killer
+        if stage < STAGE_QUIETS:
+            return
+        quiets = [move for move in moves if not move & TACTICAL << 12]
+        if history is not None:
+            quiets.sort(key=lambda move: history[move & 4095], reverse=True)
+        for move in quiets:
+            if move not in played:
+                yield move
+
+    def sortCaptures(self, moves):
+        """
+        Sort capture codes most valuable victim first and, for equal victims, least valuable attacker first.
+        A promotion counts as capturing the material the pawn gains.
+        """
+        board = self.board
+
+        def orderKey(move):
+            flags = move >> 12
+            victim = CAPTURE_ORDER_VALUES[board[move >> 9 & 7][move >> 6 & 7][1]] if flags & CAPTURE else 0
+            if flags & PROMOTION:
+                victim += CAPTURE_ORDER_VALUES[PROMOTION_PIECES[flags & 3]] - 1
+            return victim * 16 - CAPTURE_ORDER_VALUES[board[move >> 3 & 7][move & 7][1]]
+
+        return sorted(moves, key=orderKey, reverse=True)
+
+    def staticExchange(self, move):
+        """
+        Static exchange evaluation of a capture: the material (in EXCHANGE_VALUES, a pawn is 1) it wins
+        when both sides keep recapturing on its target square with their cheapest piece, each side
+        free to stop once recapturing would lose material. Pins and checks are ignored.
+        """
+        start, end = move & 63, move >> 6 & 63
+        flags = move >> 12
+        piece = self.board[start >> 3][start & 7]
+        gains = [EXCHANGE_VALUES[self.board[end >> 3][end & 7][1]]]
+        value = EXCHANGE_VALUES[piece[1]]  # Of the piece now standing on the target square
+        if flags & PROMOTION:
+            value = EXCHANGE_VALUES[PROMOTION_PIECES[flags & 3]]
+            gains[0] += value - 1
+        removed = 1 << start
+        if flags == ENPASSANT_CAPTURE:
+            removed |= 1 << (start & 56 | end & 7)  # The captured pawn stands beside the start square
+        color = "b" if piece[0] == "w" else "w"
+        while True:
+            square = self.cheapestAttacker(end, color, removed)
+            if square is None:
+                break
+            gains.append(value - gains[-1])
+            removed |= 1 << square
+            value = EXCHANGE_VALUES[self.board[square >> 3][square & 7][1]]
+            color = "b" if color == "w" else "w"
+        # Work back from the last capture: each side only recaptures if that does not lose material
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
+
+    def cheapestAttacker(self, square, color, removed=0):
+        """
+        Square of the least valuable piece of color attacking square, or None. Pieces on the squares set
+        in the removed bitmap are ignored, so sliders behind them (x-rays) count as attackers.
+        """
+        board = self.board
+        row, col = SQUARE_COORDS[square]
+        pawn_row = row + 1 if color == "w" else row - 1
+        if 0 <= pawn_row < 8:
+            pawn = color + "p"
+            for pawn_col in (col - 1, col + 1):
+                if 0 <= pawn_col < 8 and board[pawn_row][pawn_col] == pawn and \
+                        not removed >> (pawn_row * 8 + pawn_col) & 1:
+                    return pawn_row * 8 + pawn_col
+        knight = color + "N"
+        for end_row, end_col in KNIGHT_SQUARES[square]:
+            if board[end_row][end_col] == knight and not removed >> (end_row * 8 + end_col) & 1:
+                return end_row * 8 + end_col
+
+        sliders = {}
+        for j, ray in enumerate(RAY_SQUARES[square]):
+            slider = "R" if j < 4 else "B"
+            for end_row, end_col in ray:
+                if removed >> (end_row * 8 + end_col) & 1:
+                    continue
+                piece = board[end_row][end_col]
+                if piece != "--":
+                    if piece[0] == color and (piece[1] == slider or piece[1] == "Q"):
+                        sliders.setdefault(piece[1], end_row * 8 + end_col)
+                    break
+        for piece_type in "BRQ":
+            if piece_type in sliders:
+                return sliders[piece_type]
+
+        king = color + "K"
+        for end_row, end_col in KING_SQUARES[square]:
+            if board[end_row][end_col] == king and not removed >> (end_row * 8 + end_col) & 1:
+                return end_row * 8 + end_col
+        return None
+
     def inCheck(self):
         """
         Check if the current player is in check.
@@ -270,19 +722,52 @@ class GameState:
         """
         Check if a square is under attack by the opponent.
         """
-        self.white_to_move = not self.white_to_move  # Switch to the opponent's perspective
-        opponents_moves = self.getAllPossibleMoves()  # Get opponent's moves
-        self.white_to_move = not self.white_to_move  # Switch back to the current player
-        for move in opponents_moves:
-            if move.end_row == row and move.end_col == col:  # Check if the move attacks the square
+        return self.squareAttackedBy(row, col, "b" if self.white_to_move else "w")
+
+    def squareAttackedBy(self, row, col, color):
+        """
+        Check if any piece of color attacks (row, col). Works backwards from the square:
+        a knight, king or pawn of color one jump away, or a matching slider first on one of the rays.
+        """
+        board = self.board
+        knight = color + "N"
+        for end_row, end_col in KNIGHT_SQUARES[row * 8 + col]:
+            if board[end_row][end_col] == knight:
+                return True
+        king = color + "K"
+        for end_row, end_col in KING_SQUARES[row * 8 + col]:
+            if board[end_row][end_col] == king:
                 return True
+
+        # A white pawn attacks from the row below (higher index), a black pawn from the row above
+        pawn_row = row + 1 if color == "w" else row - 1
+        if 0 <= pawn_row < 8:
+            pawn = color + "p"
+            if (col > 0 and board[pawn_row][col - 1] == pawn) or (col < 7 and board[pawn_row][col + 1] == pawn):
+                return True
+
+        for j, ray in enumerate(RAY_SQUARES[row * 8 + col]):
+            slider = "R" if j < 4 else "B"
+            for end_row, end_col in ray:
+                piece = board[end_row][end_col]
+                if piece != "--":
+                    if piece[0] == color and (piece[1] == slider or piece[1] == "Q"):
+                        return True
+                    break
         return False
 
     def getAllPossibleMoves(self):
         """
         Get all possible moves without considering checks.
         """
-        moves = []
+        return [Move.fromCode(code, self.board) for code in self.getAllPossibleMoveCodes()]
+
+    def getAllPossibleMoveCodes(self):
+        """
+        Get all possible moves without considering checks, as packed codes.
+        The per-piece generators below append codes to the array they are given.
+        """
+        moves = array("H")
         for row in range(len(self.board)):
             for col in range(len(self.board[row])):
                 turn = self.board[row][col][0]
@@ -293,77 +778,79 @@ class GameState:
 
     def checkForPinsAndChecks(self):
         """
-        Look for pins and checks on the king.
+        Look for pins and checks on the king in one pass over the rays from its square.
+        Returns (in_check, pinned, check_mask): pinned is a bitmap of the pieces pinned to the king and
+        check_mask the squares a piece other than the king may move to. That is every square when not
+        in check, the checker and the squares between it and the king in single check, none in double check.
         """
-        pins = []
-        checks = []
-        in_check = False
-
         if self.white_to_move:
             enemy_color = "b"
             ally_color = "w"
-            start_row, start_col = self.white_king_location
+            king_row, king_col = self.white_king_location
         else:
             enemy_color = "w"
             ally_color = "b"
-            start_row, start_col = self.black_king_location
-
-        directions = [(-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]  # 8 possible directions
-        for j, direction in enumerate(directions):
-            possible_pin = ()
-            for i in range(1, 8):
-                end_row = start_row + direction[0] * i
-                end_col = start_col + direction[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == ally_color and end_piece[1] != "K":
-                        if possible_pin == ():
-                            possible_pin = (end_row, end_col, direction[0], direction[1])
-                        else:
-                            break
-                    elif end_piece[0] == enemy_color:
-                        enemy_type = end_piece[1]
-                        if (0 <= j <= 3 and enemy_type == "R") or \
-                                (4 <= j <= 7 and enemy_type == "B") or \
-                                (i == 1 and enemy_type == "p" and (
-                                        (enemy_color == "w" and 6 <= j <= 7) or (
-                                        enemy_color == "b" and 4 <= j <= 5))) or \
-                                enemy_type == "Q" or (i == 1 and enemy_type == "K"):
-                            if possible_pin == ():
-                                in_check = True
-                                checks.append((end_row, end_col, direction[0], direction[1]))
-                            else:
-                                pins.append(possible_pin)
-                            break
-                        break
-                else:
-                    break
+            king_row, king_col = self.black_king_location
+        king_square = king_row * 8 + king_col
+        board = self.board
+        pinned = 0
+        check_mask = ALL_SQUARES
+        in_check = False
 
-        knight_moves = [(-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2)]  # Knight's move
-        for move in knight_moves:
-            end_row = start_row + move[0]
-            end_col = start_col + move[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == "N":
+        for j, ray in enumerate(RAY_SQUARES[king_square]):
+            slider = "R" if j < 4 else "B"
+            possible_pin = -1
+            for end_row, end_col in ray:
+                end_piece = board[end_row][end_col]
+                if end_piece == "--":
+                    continue
+                if end_piece[0] == ally_color:
+                    if possible_pin >= 0:
+                        break  # Two of our own pieces in the way: no pin
+                    possible_pin = end_row * 8 + end_col
+                    continue
+                if end_piece[1] == slider or end_piece[1] == "Q":
+                    end_square = end_row * 8 + end_col
+                    if possible_pin >= 0:
+                        pinned |= 1 << possible_pin
+                    else:
+                        in_check = True
+                        # A second checker on another ray leaves nothing in common: only the king can move
+                        check_mask &= BETWEEN[king_square][end_square] | 1 << end_square
+                break
+
+        # Knights and pawns check from a fixed square and cannot be blocked
+        knight = enemy_color + "N"
+        for end_row, end_col in KNIGHT_SQUARES[king_square]:
+            if board[end_row][end_col] == knight:
+                in_check = True
+                check_mask &= 1 << (end_row * 8 + end_col)
+        pawn_row = king_row - 1 if ally_color == "w" else king_row + 1
+        if 0 <= pawn_row < 8:
+            pawn = enemy_color + "p"
+            for end_col in (king_col - 1, king_col + 1):
+                if 0 <= end_col < 8 and board[pawn_row][end_col] == pawn:
                     in_check = True
-                    checks.append((end_row, end_col, move[0], move[1]))
+                    check_mask &= 1 << (pawn_row * 8 + end_col)
 
-        return in_check, pins, checks
+        return in_check, pinned, check_mask
+
+    def allowedTargets(self, square):
+        """
+        Bitmap of the squares a piece other than the king on square may move to: the check evasion
+        squares, narrowed to the line through the king if the piece is pinned.
+        """
+        if self.pinned >> square & 1:
+            king_row, king_col = self.white_king_location if self.white_to_move else self.black_king_location
+            return self.check_mask & LINE[king_row * 8 + king_col][square]
+        return self.check_mask
 
     def getPawnMoves(self, row, col, moves):
         """
         Get all possible moves for a pawn at (row, col).
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
+        start = row * 8 + col
+        allowed = self.allowedTargets(start)
         if self.white_to_move:
             move_amount = -1
             start_row = 6
@@ -373,148 +860,132 @@ class GameState:
             start_row = 1
             enemy_color = "w"
 
-        if self.board[row + move_amount][col] == "--":  # Move 1 square forward
-            if not piece_pinned or pin_direction == (move_amount, 0):
-                moves.append(Move((row, col), (row + move_amount, col), self.board))
-                if row == start_row and self.board[row + 2 * move_amount][col] == "--":  # Move 2 squares forward
-                    moves.append(Move((row, col), (row + 2 * move_amount, col), self.board))
-
+        end = start + 8 * move_amount
+        # Only a push that promotes counts as a capture stage move
+        if self.board[row + move_amount][col] == "--" and (not self.captures_only or end < 8 or end >= 56):
+            if allowed >> end & 1:
+                self.addPawnMoves(start, end, QUIET, moves)
+            # Move 2 squares forward (may block a check the single step does not)
+            if row == start_row and self.board[row + 2 * move_amount][col] == "--" and \
+                    allowed >> (end + 8 * move_amount) & 1:
+                moves.append(packMove(start, end + 8 * move_amount, DOUBLE_PAWN_PUSH))
+
+        # En passant is tested on its own: it can capture a checking pawn off the destination square
         if col - 1 >= 0:  # Capture to the left
-            if not piece_pinned or pin_direction == (move_amount, -1):
-                if self.board[row + move_amount][col - 1][0] == enemy_color:
-                    moves.append(Move((row, col), (row + move_amount, col - 1), self.board))
-                elif (row + move_amount, col - 1) == self.enpassant_possible:
-                    moves.append(Move((row, col), (row + move_amount, col - 1), self.board, is_enpassant_move=True))
+            if self.board[row + move_amount][col - 1][0] == enemy_color:
+                if allowed >> (end - 1) & 1:
+                    self.addPawnMoves(start, end - 1, CAPTURE, moves)
+            elif (row + move_amount, col - 1) == self.enpassant_possible and \
+                    (self.pseudo_legal or self.enpassantIsLegal(row, col, col - 1)):
+                moves.append(packMove(start, end - 1, ENPASSANT_CAPTURE))
 
         if col + 1 <= 7:  # Capture to the right
-            if not piece_pinned or pin_direction == (move_amount, 1):
-                if self.board[row + move_amount][col + 1][0] == enemy_color:
-                    moves.append(Move((row, col), (row + move_amount, col + 1), self.board))
-                elif (row + move_amount, col + 1) == self.enpassant_possible:
-                    moves.append(Move((row, col), (row + move_amount, col + 1), self.board, is_enpassant_move=True))
-
-    def getRookMoves(self, row, col, moves):
+            if self.board[row + move_amount][col + 1][0] == enemy_color:
+                if allowed >> (end + 1) & 1:
+                    self.addPawnMoves(start, end + 1, CAPTURE, moves)
+            elif (row + move_amount, col + 1) == self.enpassant_possible and \
+                    (self.pseudo_legal or self.enpassantIsLegal(row, col, col + 1)):
+                moves.append(packMove(start, end + 1, ENPASSANT_CAPTURE))
+
+    def addPawnMoves(self, start, end, flags, moves):
         """
-        Get all possible moves for a rook at (row, col).
+        Add a pawn move, expanded into one move per promotion piece when it reaches the last rank.
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+        if end < 8 or end >= 56:
+            for index in range(len(PROMOTION_PIECES)):
+                moves.append(packMove(start, end, flags | PROMOTION | index))
+        else:
+            moves.append(packMove(start, end, flags))
 
-        directions = [(-1, 0), (0, -1), (1, 0), (0, 1)]  # Rook moves: up, down, left, right
+    def enpassantIsLegal(self, row, col, capture_col):
+        """
+        En passant takes two pawns off the same rank at once, which the pin scan cannot see
+        (e.g. king and enemy rook on that rank). Try the capture on the board and look for a check.
+        """
+        pawn = self.board[row][col]
+        captured = self.board[row][capture_col]
+        end_row = row - 1 if pawn[0] == "w" else row + 1
+        king_row, king_col = self.white_king_location if pawn[0] == "w" else self.black_king_location
+        self.board[row][col] = "--"
+        self.board[row][capture_col] = "--"
+        self.board[end_row][capture_col] = pawn
+        in_check = self.squareAttackedBy(king_row, king_col, captured[0])
+        self.board[end_row][capture_col] = "--"
+        self.board[row][capture_col] = captured
+        self.board[row][col] = pawn
+        return not in_check
+
+    def getSlidingMoves(self, row, col, rays, moves):
+        """
+        Add the moves along the given rays (lists of squares from RAY_SQUARES) from (row, col).
+        """
+        start = row * 8 + col
+        allowed = self.allowedTargets(start)
         enemy_color = "b" if self.white_to_move else "w"
-        for direction in directions:
-            for i in range(1, 8):
-                end_row = row + direction[0] * i
-                end_col = col + direction[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    if not piece_pinned or pin_direction == direction or pin_direction == (
-                    -direction[0], -direction[1]):
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":  # Empty square
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:  # Capture enemy piece
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
-                            break
-                        else:
-                            break
+        for ray in rays:
+            for end_row, end_col in ray:
+                end = end_row * 8 + end_col
+                end_piece = self.board[end_row][end_col]
+                if end_piece == "--":  # Empty square
+                    if allowed >> end & 1 and not self.captures_only:
+                        moves.append(packMove(start, end))
                 else:
+                    if end_piece[0] == enemy_color and allowed >> end & 1:  # Capture enemy piece
+                        moves.append(packMove(start, end, CAPTURE))
                     break
 
+    def getRookMoves(self, row, col, moves):
+        """
+        Get all possible moves for a rook at (row, col).
+        """
+        self.getSlidingMoves(row, col, RAY_SQUARES[row * 8 + col][:4], moves)
+
     def getKnightMoves(self, row, col, moves):
         """
         Get all possible moves for a knight at (row, col).
         """
-        piece_pinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                self.pins.remove(self.pins[i])
-                break
-
-        knight_moves = [(-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2)]
+        start = row * 8 + col
+        if self.pinned >> start & 1:
+            return  # A pinned knight can never stay on the pin line
         ally_color = "w" if self.white_to_move else "b"
-        for move in knight_moves:
-            end_row = row + move[0]
-            end_col = col + move[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                if not piece_pinned:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] != ally_color:
-                        moves.append(Move((row, col), (end_row, end_col), self.board))
+        for end_row, end_col in KNIGHT_SQUARES[start]:
+            end_piece = self.board[end_row][end_col]
+            if end_piece == "--" and self.captures_only:
+                continue
+            if end_piece[0] != ally_color and self.check_mask >> (end_row * 8 + end_col) & 1:
+                moves.append(packMove(start, end_row * 8 + end_col, QUIET if end_piece == "--" else CAPTURE))
 
     def getBishopMoves(self, row, col, moves):
         """
         Get all possible moves for a bishop at (row, col).
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
-        directions = [(-1, -1), (-1, 1), (1, 1), (1, -1)]  # Bishop moves: diagonals
-        enemy_color = "b" if self.white_to_move else "w"
-        for direction in directions:
-            for i in range(1, 8):
-                end_row = row + direction[0] * i
-                end_col = col + direction[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    if not piece_pinned or pin_direction == direction or pin_direction == (
-                    -direction[0], -direction[1]):
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
-                            break
-                        else:
-                            break
-                else:
-                    break
+        self.getSlidingMoves(row, col, RAY_SQUARES[row * 8 + col][4:], moves)
 
     def getQueenMoves(self, row, col, moves):
         """
         Get all possible moves for a queen at (row, col).
         The queen moves like both a rook and a bishop.
         """
-        self.getRookMoves(row, col, moves)
-        self.getBishopMoves(row, col, moves)
+        self.getSlidingMoves(row, col, RAY_SQUARES[row * 8 + col], moves)
 
     def getKingMoves(self, row, col, moves):
         """
-        Get all possible moves for a king at (row, col).
+        Get all possible moves for a king at (row, col). The king is taken off the board while
+        testing each target so it cannot hide behind itself on a checking line.
         """
-        row_moves = [-1, -1, -1, 0, 0, 1, 1, 1]
-        col_moves = [-1, 0, 1, -1, 1, -1, 0, 1]
-        ally_color = "w" if self.white_to_move else "b"
-        for i in range(8):
-            end_row = row + row_moves[i]
-            end_col = col + col_moves[i]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    # Move the king temporarily and check if it's in check
-                    if ally_color == "w":
-                        self.white_king_location = (end_row, end_col)
-                    else:
-                        self.black_king_location = (end_row, end_col)
-                    in_check, pins, checks = self.checkForPinsAndChecks()
-                    if not in_check:
-                        moves.append(Move((row, col), (end_row, end_col), self.board))
-                    # Move the king back to its original position
-                    if ally_color == "w":
-                        self.white_king_location = (row, col)
-                    else:
-                        self.black_king_location = (row, col)
+        start = row * 8 + col
+        king = self.board[row][col]
+        ally_color = king[0]
+        enemy_color = "b" if ally_color == "w" else "w"
+        self.board[row][col] = "--"
+        for end_row, end_col in KING_SQUARES[start]:
+            end_piece = self.board[end_row][end_col]
+            if end_piece == "--" and self.captures_only:
+                continue
+            if end_piece[0] != ally_color and \
+                    (self.pseudo_legal or not self.squareAttackedBy(end_row, end_col, enemy_color)):
+                moves.append(packMove(start, end_row * 8 + end_col, QUIET if end_piece == "--" else CAPTURE))
+        self.board[row][col] = king
 
     def getCastleMoves(self, row, col, moves):
         """
@@ -535,7 +1006,7 @@ class GameState:
         """
         if self.board[row][col + 1] == '--' and self.board[row][col + 2] == '--':
             if not self.squareUnderAttack(row, col + 1) and not self.squareUnderAttack(row, col + 2):
-                moves.append(Move((row, col), (row, col + 2), self.board, is_castle_move=True))
+                moves.append(packMove(row * 8 + col, row * 8 + col + 2, KING_CASTLE))
 
     def getQueensideCastleMoves(self, row, col, moves):
         """
@@ -543,32 +1014,77 @@ class GameState:
         """
         if self.board[row][col - 1] == '--' and self.board[row][col - 2] == '--' and self.board[row][col - 3] == '--':
             if not self.squareUnderAttack(row, col - 1) and not self.squareUnderAttack(row, col - 2):
-                moves.append(Move((row, col), (row, col - 2), self.board, is_castle_move=True))
+                moves.append(packMove(row * 8 + col, row * 8 + col - 2, QUEEN_CASTLE))
 
     def getBoardHash(self):
         """
-        Generates a hash for the current board position.
+        Returns the Zobrist key of the current board position (pieces, castling rights,
+        en passant file and side to move), as maintained by makeMove/undoMove.
         """
-        # Board state
-        board_string = ''.join([''.join(row) for row in self.board])
+        return self.zobrist_key
 
-        # Castling rights
-        castling_string = f"{self.current_castling_rights.wks}{self.current_castling_rights.wqs}{self.current_castling_rights.bks}{self.current_castling_rights.bqs}"
-
-        # En passant square
-        en_passant_string = f"{self.enpassant_possible}"
-
-        # Whose turn it is
-        turn_string = 'w' if self.white_to_move else 'b'
+    def computeScores(self):
+        """
+        Score of each side from scratch: the sum of SQUARE_SCORES over its pieces, as {"w": ..., "b": ...}.
+        """
+        scores = {"w": 0, "b": 0}
+        for square in range(64):
+            piece = self.board[square // 8][square % 8]
+            if piece != "--":
+                scores[piece[0]] += SQUARE_SCORES[piece][square]
+        return scores
+
+    def computePhase(self):
+        """
+        Game phase from scratch: the sum of PHASE_WEIGHTS over the pieces on the board.
+        """
+        return sum(PHASE_WEIGHTS[piece[1]] for row in self.board for piece in row if piece != "--")
 
-        # Combine all aspects into one string
-        return board_string + castling_string + en_passant_string + turn_string
+    def computePawnKey(self):
+        """
+        Zobrist key of the pawns alone, from scratch: the XOR of ZOBRIST_PIECES over every pawn.
+        """
+        key = 0
+        for square in range(64):
+            piece = self.board[square // 8][square % 8]
+            if piece[1] == "p":
+                key ^= ZOBRIST_PIECES[piece][square]
+        return key
+
+    def pawnBitboards(self):
+        """
+        Bitboards of the white and the black pawns (bit row * 8 + col set for each pawn).
+        """
+        pawns = {"wp": 0, "bp": 0}
+        for square in range(64):
+            piece = self.board[square // 8][square % 8]
+            if piece[1] == "p":
+                pawns[piece] |= 1 << square
+        return pawns["wp"], pawns["bp"]
+
+    def computeZobristKey(self):
+        """
+        Computes the Zobrist key of the current position from scratch.
+        """
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+        key ^= ZOBRIST_CASTLING[self.current_castling_rights.getIndex()]
+        if self.enpassant_possible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key
 
 
 class CastleRights:
     """
     Class to track castling rights.
     """
+    __slots__ = ("wks", "bks", "wqs", "bqs")
 
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks  # White king-side
@@ -576,27 +1092,71 @@ class CastleRights:
         self.wqs = wqs  # White queen-side
         self.bqs = bqs  # Black queen-side
 
+    def getIndex(self):
+        """
+        Packs the four rights into a number from 0 to 15.
+        """
+        return self.wks | self.bks << 1 | self.wqs << 2 | self.bqs << 3
+
 
 class Move:
     """
     Class for handling chess moves and their notation.
+    The engine itself works on packed codes (see packMove); a Move is built around a code for the UI,
+    notation and other callers, and carries the code along in self.code.
     """
+    __slots__ = ("start_row", "start_col", "end_row", "end_col", "piece_moved", "piece_captured",
+                 "is_pawn_promotion", "promotion_piece", "is_enpassant_move", "is_castle_move", "is_capture",
+                 "moveID", "code")
     ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rows_to_ranks = {v: k for k, v in ranks_to_rows.items()}
     files_to_cols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     cols_to_files = {v: k for k, v in files_to_cols.items()}
 
-    def __init__(self, start_square, end_square, board, is_enpassant_move=False, is_castle_move=False):
+    def __init__(self, start_square, end_square, board, is_enpassant_move=False, is_castle_move=False,
+                 promotion_piece="Q"):
         self.start_row = start_square[0]
         self.start_col = start_square[1]
         self.end_row = end_square[0]
         self.end_col = end_square[1]
         self.piece_moved = board[self.start_row][self.start_col]
         self.piece_captured = board[self.end_row][self.end_col]
+        self.setFlags(is_enpassant_move, is_castle_move, promotion_piece)
 
+    @classmethod
+    def fromCode(cls, code, board):
+        """
+        Build the Move for a packed code. board must be the position the move is played from.
+        """
+        flags = code >> 12
+        return cls(SQUARE_COORDS[code & 63], SQUARE_COORDS[code >> 6 & 63], board,
+                   is_enpassant_move=flags == ENPASSANT_CAPTURE,
+                   is_castle_move=flags == KING_CASTLE or flags == QUEEN_CASTLE,
+                   promotion_piece=PROMOTION_PIECES[flags & 3] if flags & PROMOTION else "Q")
+
+    @classmethod
+    def fromLog(cls, code, piece_moved, piece_captured):
+        """
+        Build the Move for a packed code from the pieces involved, once the board it was played on is gone.
+        """
+        move = cls.__new__(cls)
+        move.start_row, move.start_col = SQUARE_COORDS[code & 63]
+        move.end_row, move.end_col = SQUARE_COORDS[code >> 6 & 63]
+        move.piece_moved = piece_moved
+        move.piece_captured = piece_captured
+        flags = code >> 12
+        move.setFlags(flags == ENPASSANT_CAPTURE, flags == KING_CASTLE or flags == QUEEN_CASTLE,
+                      PROMOTION_PIECES[flags & 3] if flags & PROMOTION else "Q")
+        return move
+
+    def setFlags(self, is_enpassant_move, is_castle_move, promotion_piece):
+        """
+        Fill in everything that follows from the squares and pieces, including the packed code.
+        """
         # Check for pawn promotion
         self.is_pawn_promotion = (self.piece_moved == "wp" and self.end_row == 0) or \
                                  (self.piece_moved == "bp" and self.end_row == 7)
+        self.promotion_piece = promotion_piece  # Piece type the pawn becomes ("Q", "R", "B" or "N")
 
         # Check for en passant
         self.is_enpassant_move = is_enpassant_move
@@ -608,6 +1168,20 @@ class Move:
 
         self.is_capture = self.piece_captured != "--"
         self.moveID = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+        if self.is_pawn_promotion:  # Under-promotions get their own IDs, a queen promotion keeps the plain one
+            self.moveID += 10000 * PROMOTION_PIECES.index(promotion_piece)
+
+        if is_castle_move:
+            flags = KING_CASTLE if self.end_col > self.start_col else QUEEN_CASTLE
+        elif is_enpassant_move:
+            flags = ENPASSANT_CAPTURE
+        else:
+            flags = CAPTURE if self.is_capture else QUIET
+            if self.is_pawn_promotion:
+                flags |= PROMOTION | PROMOTION_PIECES.index(promotion_piece)
+            elif self.piece_moved[1] == "p" and abs(self.end_row - self.start_row) == 2:
+                flags = DOUBLE_PAWN_PUSH
+        self.code = packMove(self.start_row * 8 + self.start_col, self.end_row * 8 + self.end_col, flags)
 
     def __eq__(self, other):
         """
@@ -622,7 +1196,7 @@ class Move:
         Returns the move in standard chess notation.
         """
         if self.is_pawn_promotion:
-            return self.getRankFile(self.end_row, self.end_col) + "Q"
+            return self.getRankFile(self.end_row, self.end_col) + self.promotion_piece
         if self.is_castle_move:
             return "0-0" if self.end_col == 6 else "0-0-0"
         if self.is_enpassant_move:
@@ -640,6 +1214,13 @@ class Move:
             else:
                 return self.piece_moved[1] + self.getRankFile(self.end_row, self.end_col)
 
+    def getUCINotation(self):
+        """
+        Returns the move as start square + end square (+ promotion piece), e.g. "e2e4" or "e7e8q".
+        """
+        notation = self.getRankFile(self.start_row, self.start_col) + self.getRankFile(self.end_row, self.end_col)
+        return notation + self.promotion_piece.lower() if self.is_pawn_promotion else notation
+
     def getRankFile(self, row, col):
         """
         Converts the row and column into standard chess notation.
@@ -655,11 +1236,51 @@ class Move:
         end_square = self.getRankFile(self.end_row, self.end_col)
         if self.piece_moved[1] == "p":
             if self.is_capture:
-                return self.cols_to_files[self.start_col] + "x" + end_square
-            else:
-                return end_square + "Q" if self.is_pawn_promotion else end_square
+                end_square = self.cols_to_files[self.start_col] + "x" + end_square
+            return end_square + self.promotion_piece if self.is_pawn_promotion else end_square
         move_string = self.piece_moved[1]
         if self.is_capture:
             move_string += "x"
         return move_string + end_square
 
+
+class MoveLog:
+    """
+    The moves played so far, as GameState.move_log. Only the packed code and the pieces involved are
+    stored; indexing or iterating builds Move objects, so makeMoveCode never has to allocate one.
+    """
+    __slots__ = ("codes", "pieces_moved", "pieces_captured")
+
+    def __init__(self):
+        self.codes = array("H")
+        self.pieces_moved = []
+        self.pieces_captured = []
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.codes)))]
+        return Move.fromLog(self.codes[index], self.pieces_moved[index], self.pieces_captured[index])
+
+    def __iter__(self):
+        for index in range(len(self.codes)):
+            yield self[index]
+
+    def push(self, code, piece_moved, piece_captured):
+        self.codes.append(code)
+        self.pieces_moved.append(piece_moved)
+        self.pieces_captured.append(piece_captured)
+
+    def peek(self):
+        """
+        Returns (code, piece_moved, piece_captured) of the last move.
+        """
+        return self.codes[-1], self.pieces_moved[-1], self.pieces_captured[-1]
+
+    def pop(self):
+        """
+        Removes the last move and returns (code, piece_moved, piece_captured).
+        """
+        return self.codes.pop(), self.pieces_moved.pop(), self.pieces_captured.pop()
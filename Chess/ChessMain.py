@@ -4,9 +4,10 @@ It will handle user input and draw the current game state to the screen.
 """
 
 import pygame as p
-import ChessEngine, ChessAI
+import ChessEngine, ChessAI, BitboardEngine
+import os
 import sys
-from multiprocessing import Process, Queue
+from multiprocessing import Event, Process, Queue
 
 # Board size and other UI settings
 BOARD_WIDTH = BOARD_HEIGHT = 512  # Size of the chess board
@@ -15,7 +16,14 @@ MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
 DIMENSION = 8  # Chess board is 8x8
 SQUARE_SIZE = BOARD_HEIGHT // DIMENSION  # Size of each square
 MAX_FPS = 120  # Frames per second (for smooth animations)
+AI_MOVE_TIME = 3000  # Milliseconds the AI may think per move
+AI_WORKERS = os.cpu_count() or 1  # Processes searching each AI move (lazy SMP when more than one)
+# Keep one AI process for the game that also thinks on the human's time. It searches in a single process,
+# so AI_WORKERS is then unused: pondering trades the extra cores for the human's thinking time.
+AI_PONDER = True
 IMAGES = {}  # Dictionary to hold piece images
+GAME_STATE_BACKENDS = {"board": ChessEngine.GameState,  # Original 8x8 string board
+                       "bitboard": BitboardEngine.BitboardGameState}  # Same API, faster move generation
 
 
 def loadImages():
@@ -29,16 +37,17 @@ def loadImages():
         IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQUARE_SIZE, SQUARE_SIZE))
 
 
-def main():
+def main(backend="bitboard"):
     """
     The main function where everything happens:
     Initializes the game, handles user input, updates the game state, and displays it.
+    backend picks the game state implementation from GAME_STATE_BACKENDS.
     """
     p.init()  # Initialize pygame
     screen = p.display.set_mode((BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH, BOARD_HEIGHT))  # Create screen
     clock = p.time.Clock()  # Set up clock for smooth animations
     screen.fill(p.Color("white"))  # Fill screen with white to start
-    game_state = ChessEngine.GameState()  # Create a new GameState object (the board)
+    game_state = GAME_STATE_BACKENDS[backend]()  # Create a new GameState object (the board)
     valid_moves = game_state.getValidMoves()  # Get the list of valid moves at the start
     move_made = False  # Flag for when a move is made
     animate = False  # Flag to animate the move
@@ -50,9 +59,13 @@ def main():
     ai_thinking = False  # AI thinking flag
     move_undone = False  # Track if a move was undone
     move_finder_process = None  # For AI multiprocessing
+    stop_search = None  # Set to end the AI search early
     move_log_font = p.font.SysFont("Arial", 14, False, False)  # Font for move log
     player_one = True  # True, as this is the player
     player_two = True  # Is player two a human?, false for ai
+    ai_limits = ChessAI.SearchLimits(move_time=AI_MOVE_TIME)
+    engine = ChessAI.PonderingEngine() if AI_PONDER and not (player_one and player_two) else None
+    ai_moved = False  # The AI just moved: start pondering once the human's moves are known
 
     while running:
         human_turn = (game_state.white_to_move and player_one) or (not game_state.white_to_move and player_two)
@@ -92,45 +105,65 @@ def main():
                     move_made = True
                     animate = False
                     game_over = False
-                    if ai_thinking:
-                        move_finder_process.terminate()
-                        ai_thinking = False
+                    if engine:
+                        engine.stop()
+                    elif ai_thinking:
+                        stop_search.set()  # Let the search clean up its helper processes, unlike terminate()
+                        move_finder_process.join()
+                    ai_thinking = False
                     move_undone = True
                 if e.key == p.K_r:  # Reset the game when 'r' is pressed
-                    game_state = ChessEngine.GameState()
+                    game_state = GAME_STATE_BACKENDS[backend]()
                     valid_moves = game_state.getValidMoves()
                     square_selected = ()
                     player_clicks = []
                     move_made = False
                     animate = False
                     game_over = False
-                    game_state.position_count = {}  # Reset position count
-                    if ai_thinking:
-                        move_finder_process.terminate()
-                        ai_thinking = False
+                    if engine:
+                        engine.newGame()
+                    elif ai_thinking:
+                        stop_search.set()  # Let the search clean up its helper processes, unlike terminate()
+                        move_finder_process.join()
+                    ai_thinking = False
                     move_undone = True
 
         # Handle AI moves
         if not game_over and not human_turn and not move_undone:
             if not ai_thinking:
                 ai_thinking = True
-                return_queue = Queue()  # Used to pass data between threads
-                move_finder_process = Process(target=ChessAI.findBestMove, args=(game_state, valid_moves, return_queue))
-                move_finder_process.start()
-
-            if not move_finder_process.is_alive():
-                ai_move = return_queue.get()
-                if ai_move is None:
-                    ai_move = ChessAI.findRandomMove(valid_moves)
+                if engine:
+                    engine.go(game_state, valid_moves, ai_limits)  # Goes on with the ponder search on a hit
+                else:
+                    return_queue = Queue()  # Used to pass data between threads
+                    stop_search = Event()
+                    move_finder_process = Process(target=ChessAI.findBestMove,
+                                                  args=(game_state, valid_moves, return_queue, ai_limits, None,
+                                                        AI_WORKERS, stop_search))
+                    move_finder_process.start()
+
+            ai_move = None
+            if engine:
+                result = engine.poll()
+                if result is not None:
+                    ai_move = next((move for move in valid_moves if move.code == result.best_move), None) or \
+                        ChessAI.findRandomMove(valid_moves)
+            elif not move_finder_process.is_alive():
+                ai_move = return_queue.get() or ChessAI.findRandomMove(valid_moves)
+            if ai_move is not None:
                 game_state.makeMove(ai_move)
                 move_made = True
                 animate = True
                 ai_thinking = False
+                ai_moved = True
 
         if move_made:
             if animate:
                 animateMove(game_state.move_log[-1], screen, game_state.board, clock)
             valid_moves = game_state.getValidMoves()  # Recalculate valid moves after the move
+            if engine and ai_moved and not move_undone:
+                engine.ponder(game_state, valid_moves, ai_limits)  # Think about the reply the AI expects
+            ai_moved = False
             move_made = False
             animate = False
             move_undone = False
@@ -148,6 +181,8 @@ def main():
             elif game_state.stalemate:
                 game_over = True
                 drawEndGameText(screen, "Stalemate")
+            if game_over and engine:
+                engine.stop()  # A ponder search has no limits of its own, and no go will follow to bound it
 
         # Only draw game state if game is not over
         if not game_over:
@@ -0,0 +1,141 @@
+"""
+Piece values and piece-square tables of the AI evaluation (see ChessAI.scoreBoard).
+Every piece has a middlegame and an endgame value; the score of a position blends the two by the
+game phase, which falls from MAX_PHASE with all pieces on the board to 0 with only kings and pawns.
+GameState keeps each side's total and the phase up to date as moves are made and undone, so the
+search reads the score of a position without scanning the board.
+"""
+
+# Centipawns
+MIDGAME_VALUES = {"p": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+ENDGAME_VALUES = {"p": 120, "N": 300, "B": 320, "R": 520, "Q": 900, "K": 0}
+
+# Piece-square tables in centipawns for white, indexed by square (row * 8 + col, a8 first).
+# Black uses the same tables flipped top to bottom (square ^ 56).
+PAWN_MIDGAME = [0, 0, 0, 0, 0, 0, 0, 0,
+                50, 50, 50, 50, 50, 50, 50, 50,
+                10, 10, 20, 30, 30, 20, 10, 10,
+                5, 5, 10, 25, 25, 10, 5, 5,
+                0, 0, 0, 20, 20, 0, 0, 0,
+                5, -5, -10, 0, 0, -10, -5, 5,
+                5, 10, 10, -20, -20, 10, 10, 5,
+                0, 0, 0, 0, 0, 0, 0, 0]
+
+PAWN_ENDGAME = [0, 0, 0, 0, 0, 0, 0, 0,
+                80, 80, 80, 80, 80, 80, 80, 80,
+                50, 50, 50, 50, 50, 50, 50, 50,
+                30, 30, 30, 30, 30, 30, 30, 30,
+                20, 20, 20, 20, 20, 20, 20, 20,
+                10, 10, 10, 10, 10, 10, 10, 10,
+                0, 0, 0, 0, 0, 0, 0, 0,
+                0, 0, 0, 0, 0, 0, 0, 0]
+
+KNIGHT_TABLE = [-50, -40, -30, -30, -30, -30, -40, -50,
+                -40, -20, 0, 0, 0, 0, -20, -40,
+                -30, 0, 10, 15, 15, 10, 0, -30,
+                -30, 5, 15, 20, 20, 15, 5, -30,
+                -30, 0, 15, 20, 20, 15, 0, -30,
+                -30, 5, 10, 15, 15, 10, 5, -30,
+                -40, -20, 0, 5, 5, 0, -20, -40,
+                -50, -40, -30, -30, -30, -30, -40, -50]
+
+BISHOP_TABLE = [-20, -10, -10, -10, -10, -10, -10, -20,
+                -10, 0, 0, 0, 0, 0, 0, -10,
+                -10, 0, 5, 10, 10, 5, 0, -10,
+                -10, 5, 5, 10, 10, 5, 5, -10,
+                -10, 0, 10, 10, 10, 10, 0, -10,
+                -10, 10, 10, 10, 10, 10, 10, -10,
+                -10, 5, 0, 0, 0, 0, 5, -10,
+                -20, -10, -10, -10, -10, -10, -10, -20]
+
+ROOK_TABLE = [0, 0, 0, 0, 0, 0, 0, 0,
+              5, 10, 10, 10, 10, 10, 10, 5,
+              -5, 0, 0, 0, 0, 0, 0, -5,
+              -5, 0, 0, 0, 0, 0, 0, -5,
+              -5, 0, 0, 0, 0, 0, 0, -5,
+              -5, 0, 0, 0, 0, 0, 0, -5,
+              -5, 0, 0, 0, 0, 0, 0, -5,
+              0, 0, 0, 5, 5, 0, 0, 0]
+
+QUEEN_TABLE = [-20, -10, -10, -5, -5, -10, -10, -20,
+               -10, 0, 0, 0, 0, 0, 0, -10,
+               -10, 0, 5, 5, 5, 5, 0, -10,
+               -5, 0, 5, 5, 5, 5, 0, -5,
+               0, 0, 5, 5, 5, 5, 0, -5,
+               -10, 5, 5, 5, 5, 5, 0, -10,
+               -10, 0, 5, 0, 0, 0, 0, -10,
+               -20, -10, -10, -5, -5, -10, -10, -20]
+
+# Shelter behind the pawns while there is material to attack it...
+KING_MIDGAME = [-30, -40, -40, -50, -50, -40, -40, -30,
+                -30, -40, -40, -50, -50, -40, -40, -30,
+                -30, -40, -40, -50, -50, -40, -40, -30,
+                -30, -40, -40, -50, -50, -40, -40, -30,
+                -20, -30, -30, -40, -40, -30, -30, -20,
+                -10, -20, -20, -20, -20, -20, -20, -10,
+                20, 20, 0, 0, 0, 0, 20, 20,
+                20, 30, 10, 0, 0, 10, 30, 20]
+
+# ...and come to the centre once it is gone
+KING_ENDGAME = [-50, -40, -30, -20, -20, -30, -40, -50,
+                -30, -20, -10, 0, 0, -10, -20, -30,
+                -30, -10, 20, 30, 30, 20, -10, -30,
+                -30, -10, 30, 40, 40, 30, -10, -30,
+                -30, -10, 30, 40, 40, 30, -10, -30,
+                -30, -10, 20, 30, 30, 20, -10, -30,
+                -30, -30, 0, 0, 0, 0, -30, -30,
+                -50, -30, -30, -30, -30, -30, -30, -50]
+
+MIDGAME_TABLES = {"p": PAWN_MIDGAME, "N": KNIGHT_TABLE, "B": BISHOP_TABLE, "R": ROOK_TABLE, "Q": QUEEN_TABLE,
+                  "K": KING_MIDGAME}
+ENDGAME_TABLES = dict(MIDGAME_TABLES, p=PAWN_ENDGAME, K=KING_ENDGAME)
+
+# Contribution of each piece to the game phase
+PHASE_WEIGHTS = {"p": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0}
+MAX_PHASE = 24  # Phase of the starting position; promotions can push it higher, which counts as MAX_PHASE
+
+# A middlegame and an endgame score travel together as one integer: midgame + (endgame << ENDGAME_SHIFT).
+# Sums and differences of packed scores are the packed sums and differences, so one addition updates both.
+ENDGAME_SHIFT = 32
+
+
+def packScore(midgame, endgame):
+    return midgame + (endgame << ENDGAME_SHIFT)
+
+
+def unpackScore(score):
+    """
+    Split a packed score into (midgame, endgame).
+    """
+    endgame = (score + (1 << (ENDGAME_SHIFT - 1))) >> ENDGAME_SHIFT
+    return score - (endgame << ENDGAME_SHIFT), endgame
+
+
+def taperedScore(score, phase):
+    """
+    Blend a packed score into whole centipawns: all midgame at MAX_PHASE, all endgame at phase 0.
+    Floored rather than divided exactly: fractions of 1/MAX_PHASE centipawn would be finer than the
+    search's null window (ChessAI.NULL_WINDOW) and the transposition table's fixed point, so null-window
+    searches could no longer tell a score from one a step better.
+    """
+    midgame, endgame = unpackScore(score)
+    phase = min(phase, MAX_PHASE)
+    return (midgame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+def _squareScores():
+    """
+    Packed value of every piece on every square (index row * 8 + col): material plus position.
+    Integers, so GameState can add and subtract them move after move without rounding drift.
+    """
+    scores = {}
+    for piece_type in MIDGAME_VALUES:
+        midgame_table, endgame_table = MIDGAME_TABLES[piece_type], ENDGAME_TABLES[piece_type]
+        for color, flip in (("w", 0), ("b", 56)):
+            scores[color + piece_type] = [packScore(MIDGAME_VALUES[piece_type] + midgame_table[square ^ flip],
+                                                    ENDGAME_VALUES[piece_type] + endgame_table[square ^ flip])
+                                          for square in range(64)]
+    return scores
+
+
+SQUARE_SCORES = _squareScores()
@@ -0,0 +1,94 @@
+"""
+Pawn-structure evaluation: doubled, isolated and passed pawns.
+Pawns move rarely compared to the other pieces, so the same structure turns up in most leaves of a
+search tree. Its score is cached in a PawnHashTable keyed by GameState.pawn_key, the Zobrist key of
+the pawns alone, and only worked out again when the pawns change.
+"""
+from Evaluation import packScore
+from ScoreCache import ScoreCache
+
+PAWN_TABLE_ENTRIES = 1 << 14  # Power of two, so an entry is found by masking the key
+
+# Packed middlegame/endgame scores in centipawns (see Evaluation.packScore)
+DOUBLED_PAWN = packScore(-10, -20)  # For each pawn beyond the first on a file
+ISOLATED_PAWN = packScore(-10, -15)  # For each pawn with no friendly pawn on the files beside it
+# For a passed pawn, by the number of rows it has advanced from its starting row
+PASSED_PAWN = [packScore(midgame, endgame) for midgame, endgame in
+               ((5, 10), (5, 15), (10, 25), (20, 45), (35, 75), (60, 120))]
+
+# Squares are numbered row * 8 + col as in GameState.board; white pawns move towards row 0
+FILES = [0x0101010101010101 << col for col in range(8)]
+ADJACENT_FILES = [(FILES[col - 1] if col > 0 else 0) | (FILES[col + 1] if col < 7 else 0) for col in range(8)]
+
+
+def _passedMasks():
+    """
+    Squares ahead of a pawn on its own and the adjacent files, per color (white, black) and square.
+    The pawn is passed when no enemy pawn stands on them.
+    """
+    white, black = [], []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        files = FILES[col] | ADJACENT_FILES[col]
+        white.append(files & ((1 << row * 8) - 1))
+        black.append(files & ~((1 << (row + 1) * 8) - 1))
+    return white, black
+
+
+PASSED_MASKS = _passedMasks()
+
+
+def popcount(bitboard):
+    return bin(bitboard).count("1")
+
+
+def evaluatePawns(white_pawns, black_pawns):
+    """
+    Packed score of the pawn structure, white minus black, given the bitboards of both sides' pawns.
+    """
+    score = 0
+    for pawns, enemy_pawns, passed_masks, color in ((white_pawns, black_pawns, PASSED_MASKS[0], "w"),
+                                                    (black_pawns, white_pawns, PASSED_MASKS[1], "b")):
+        side_score = 0
+        for col in range(8):
+            count = popcount(pawns & FILES[col])
+            if count > 1:
+                side_score += DOUBLED_PAWN * (count - 1)
+            if count and not pawns & ADJACENT_FILES[col]:
+                side_score += ISOLATED_PAWN * count
+
+        remaining = pawns
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            square = bit.bit_length() - 1
+            # A pawn behind a friendly pawn on its file is not counted as passed as well
+            if not (enemy_pawns | pawns & FILES[square & 7]) & passed_masks[square]:
+                side_score += PASSED_PAWN[6 - square // 8 if color == "w" else square // 8 - 1]
+
+        score += side_score if color == "w" else -side_score
+    return score
+
+
+class PawnHashTable(ScoreCache):
+    """
+    Cache of evaluatePawns results by pawn key. An empty entry (key 0, score 0) is right for no pawns.
+    """
+
+    def __init__(self, entries=PAWN_TABLE_ENTRIES):
+        super().__init__(entries, "q")
+
+
+def pawnScore(game_state, pawn_hash_table=None):
+    """
+    Packed pawn-structure score of the position, white minus black, looked up in pawn_hash_table when
+    one is given.
+    """
+    if pawn_hash_table is None:
+        return evaluatePawns(*game_state.pawnBitboards())
+    key = game_state.pawn_key
+    score = pawn_hash_table.probe(key)
+    if score is None:
+        score = evaluatePawns(*game_state.pawnBitboards())
+        pawn_hash_table.store(key, score)
+    return score
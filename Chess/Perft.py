@@ -0,0 +1,153 @@
+"""
+Perft: count the leaf nodes of the legal move tree to a fixed depth.
+The counts for the reference positions below are known exactly, so any difference points at a
+move generation bug; the timings give a throughput baseline for the game state backends.
+
+    python Perft.py --suite                   # check every reference position
+    python Perft.py --depth 4                 # count from the start position
+    python Perft.py --fen "<fen>" --depth 3 --divide --backend board
+"""
+import argparse
+import sys
+import time
+
+import ChessEngine
+import BitboardEngine
+
+BACKENDS = {"board": ChessEngine.GameState, "bitboard": BitboardEngine.BitboardGameState}
+
+# (name, FEN, node counts for depth 1, 2, 3, ...)
+REFERENCE_POSITIONS = [
+    ("start", ChessEngine.START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("en passant pins", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("promotions and checks", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("promotion with castling", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def newGameState(fen=ChessEngine.START_FEN, backend="bitboard"):
+    game_state = BACKENDS[backend]()
+    game_state.loadFEN(fen)
+    return game_state
+
+
+def perft(game_state, depth, legal=True):
+    """
+    Number of leaf nodes of the legal move tree below game_state at the given depth.
+    With legal=False the moves are generated pseudo-legal and filtered after making them.
+    """
+    if not legal:
+        return pseudoLegalPerft(game_state, depth)
+    moves = game_state.getValidMoveCodes()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        game_state.makeMoveCode(move)
+        nodes += perft(game_state, depth - 1)
+        game_state.undoMoveCode()
+    return nodes
+
+
+def pseudoLegalPerft(game_state, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in game_state.getPseudoLegalMoveCodes():
+        game_state.makeMoveCode(move)
+        if not game_state.moveLeftKingInCheck():
+            nodes += pseudoLegalPerft(game_state, depth - 1)
+        game_state.undoMoveCode()
+    return nodes
+
+
+def divide(game_state, depth, legal=True):
+    """
+    Perft split by root move: {move in UCI notation: leaf nodes below it}. legal as for perft.
+    """
+    counts = {}
+    moves = game_state.getValidMoveCodes() if legal else game_state.getPseudoLegalMoveCodes()
+    for code in moves:
+        move = ChessEngine.Move.fromCode(code, game_state.board)
+        game_state.makeMoveCode(code)
+        if legal or not game_state.moveLeftKingInCheck():
+            counts[move.getUCINotation()] = perft(game_state, depth - 1, legal)
+        game_state.undoMoveCode()
+    return counts
+
+
+def timedPerft(game_state, depth, legal=True):
+    """
+    Run perft and return (nodes, seconds, nodes per second).
+    """
+    start = time.perf_counter()
+    nodes = perft(game_state, depth, legal)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0
+
+
+def runSuite(backend="bitboard", max_nodes=100000, output=sys.stdout, legal=True):
+    """
+    Check every reference position up to the deepest depth whose expected count is at most max_nodes.
+    Returns the list of (name, depth, expected, actual) mismatches.
+    """
+    failures = []
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected_counts in REFERENCE_POSITIONS:
+        for depth, expected in enumerate(expected_counts, start=1):
+            if expected > max_nodes:
+                break
+            nodes, elapsed, nps = timedPerft(newGameState(fen, backend), depth, legal)
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected else f"FAIL (expected {expected})"
+            print(f"{name:<24} depth {depth}  {nodes:>9} nodes  {elapsed:7.2f}s  {nps:9.0f} n/s  {status}", file=output)
+            if nodes != expected:
+                failures.append((name, depth, expected, nodes))
+    if total_time > 0:
+        print(f"{backend}: {total_nodes} nodes in {total_time:.2f}s ({total_nodes / total_time:.0f} n/s)", file=output)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count move generation leaf nodes (perft).")
+    parser.add_argument("--fen", default=ChessEngine.START_FEN, help="position to start from")
+    parser.add_argument("--depth", type=int, default=3, help="search depth in plies")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    parser.add_argument("--suite", action="store_true", help="check all reference positions")
+    parser.add_argument("--max-nodes", type=int, default=100000,
+                        help="with --suite, skip depths whose expected count is larger than this")
+    parser.add_argument("--pseudo-legal", action="store_true",
+                        help="generate pseudo-legal moves and test king safety after each one")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        failures = runSuite(args.backend, args.max_nodes, legal=not args.pseudo_legal)
+        return 1 if failures else 0
+
+    game_state = newGameState(args.fen, args.backend)
+    if args.divide:
+        start = time.perf_counter()
+        counts = divide(game_state, args.depth, not args.pseudo_legal)
+        elapsed = time.perf_counter() - start
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}")
+        nodes = sum(counts.values())
+    else:
+        nodes, elapsed, _ = timedPerft(game_state, args.depth, not args.pseudo_legal)
+    print(f"nodes {nodes}  time {elapsed:.2f}s  {nodes / elapsed if elapsed > 0 else 0:.0f} n/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
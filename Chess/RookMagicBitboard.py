@@ -1,103 +1,208 @@
 '''
-A file to generate rook moves based on the magic bitboard
-testing stage
+Magic bitboard sliding attacks for rooks, bishops and queens.
+Squares are numbered row * 8 + col (bit 0 is a8, bit 63 is h1), the same layout as BitboardEngine.
+The tables built from these numbers are cached and looked up in AttackTables.
+Run this file directly to search for a fresh set of magic numbers.
 '''
+import random
 
-# Simple magic numbers for each square on the chessboard (for rooks)
+MASK_64 = (1 << 64) - 1
+
+# Magic numbers for each square on the chessboard, checked for collisions when the tables are built
 ROOK_MAGIC_NUMBERS = [
-    0xA8002C000108020, 0x6C00049B0002001, 0x100200010090040, 0x2480041000800801,
-    0x280028004000800, 0x900410008040022, 0x280020001001080, 0x2880002041000080,
-    0xA000800080400034, 0x4808020004000, 0x2290802004801000, 0x411000D00100020,
-    0x402800800040080, 0xB000401004208, 0x2409000100040200, 0x1002100004082,
-    0x4084100010010C0, 0x401201400080080, 0x410010004200, 0x140081040004008,
-    0x900100410008040, 0x8000400801980, 0x100030008010008, 0x801000802000,
-    0x402000400808020, 0x2001101000801, 0x8040002811040200, 0x220008400840012,
-    0x20484000420020, 0x180900008020420, 0x1001048200020, 0x100088020040800,
-    0x40080900200080, 0x800008041000C0, 0x20002002005000C0, 0x4000040840402001,
-    0x2400200041000400, 0x100040080080080, 0x8000800041000200, 0x200200080100040,
-    0x1002000100080410, 0x8002000200840100, 0x8004100020820201, 0x200800400880200,
-    0x400020804080200, 0x2801808080204000, 0x1204104000840080, 0x4000C02008208400,
-    0x1000040080840420, 0x8000800080401000, 0x1040080044101002, 0x8084000040008080,
-    0x20800400800400, 0x2400400080012080, 0x1000010020402004, 0x8020004000400,
-    0x800820000820008, 0x400200040000210, 0x40100400008000, 0x400080200080800,
-    0x200040000008020, 0x2080010002008080, 0x1001000200008020, 0x1080000080204008
+    0x2080001440022581, 0x1080200040001080, 0x4080100008200080, 0x0280080080100254,
+    0x4D8004000A180080, 0x0100080400020100, 0x1080010040800200, 0x0200004402002081,
+    0x0068800024884004, 0x1000804000802002, 0x000200208A001040, 0x3008801000800800,
+    0x2006001060440A00, 0x1000800200800400, 0x0004000441024810, 0xA001000082004100,
+    0x0040808000204014, 0x0000424002201000, 0x0010110041002000, 0x0000090021041000,
+    0x0204008004800800, 0x0000808004000200, 0x6006040021485042, 0x0000020002409924,
+    0x2000401980028020, 0x4000400100308100, 0x0000820200201041, 0xB100100080800800,
+    0x3004080080040080, 0x0802000200041009, 0x01A0580400021110, 0x00020042000408A1,
+    0x4218884000800023, 0x0480201000400045, 0x0010200080801000, 0x1200200901001000,
+    0x0000100801000500, 0x0080020080800400, 0x004A000100404080, 0x0480005402001081,
+    0x258000402000C000, 0xA010004820084002, 0x0480200010008080, 0x244100100021000C,
+    0x2040080005010010, 0x0012000810020004, 0x0011000200B9000C, 0x1121000080410002,
+    0x00082080410A0600, 0x4002008100402600, 0x0A0300E008544100, 0x7B00080010008080,
+    0x0300080100100500, 0x0002020080040080, 0x0042521810214400, 0x8A00004089140200,
+    0x00001280010A2041, 0x0400401102042086, 0x41902000100C4101, 0x0043020420900009,
+    0x00E2000410082002, 0x4402000108041002, 0x2100101A00814804, 0x0400010400218246
+]
+
+BISHOP_MAGIC_NUMBERS = [
+    0x0102040418220020, 0x0108024802002028, 0x8010044040400001, 0x0022209200044800,
+    0x4004504005040114, 0x0022010420A80800, 0x0008441008090002, 0x0000420801480200,
+    0x1100220244011C00, 0x00883004081AB020, 0x4400100152002000, 0x4019080841004000,
+    0x2861021210000000, 0x400EA10108400020, 0x4800208208A24000, 0x0020A500A0842085,
+    0x3410000802504400, 0x0010E0200C010060, 0x0014182042408200, 0x4094006840112109,
+    0x2014200202010000, 0x000100020080C400, 0x800400420D2C0200, 0x0002200182251000,
+    0x0010F10304C41000, 0x001024A008281084, 0x0088110002040100, 0x0820080001004008,
+    0x0104040020410050, 0x0110002027040500, 0x418C008009182100, 0x2C00A9040C80480B,
+    0x008110C8005020A4, 0x4004210802041000, 0x0004020108208100, 0x0000080800120A00,
+    0x430C008400820102, 0x1400808100020108, 0x005006020010A8A0, 0x000801868004A220,
+    0x00420105C00C2000, 0x1010921032019040, 0x0300222028103000, 0x0008004208001080,
+    0x5410202248811400, 0x0008010800800808, 0x3C02C20404000900, 0x0408022282040032,
+    0x0000941002100000, 0x0112209A10100804, 0x080C020111210000, 0x442002A442022008,
+    0x00084A181B040000, 0x00115021021C2080, 0x4010051000A20000, 0x0404688085060000,
+    0x0000220110011000, 0x140000220734200C, 0x0440010424020800, 0x2204828883460800,
+    0x0020000004050410, 0x4060004A20082080, 0x00489034B002C201, 0x0444049010410300
 ]
+
+
 def rook_occupancy_mask(square):
+    """
+    Squares whose occupancy matters for a rook on square. Edge squares are left out:
+    a blocker there cannot hide anything behind it.
+    """
     rank = square // 8
     file = square % 8
     mask = 0
 
     # Horizontal mask (rank)
-    for i in range(8):
+    for i in range(1, 7):
         if i != file:
             mask |= (1 << (rank * 8 + i))
 
     # Vertical mask (file)
-    for i in range(8):
+    for i in range(1, 7):
         if i != rank:
             mask |= (1 << (i * 8 + file))
 
     return mask
 
 
-def generate_rook_attack_table(square, magic_number):
-    occupancy_mask = rook_occupancy_mask(square)
-    num_relevant_bits = bin(occupancy_mask).count('1')
-
-    attack_table_size = 1 << num_relevant_bits  # Calculate the size of the attack table
-    attack_table = [0] * attack_table_size      # Initialize the attack table
-
-    for index in range(attack_table_size):
-        occupancy = index_to_occupancy(index, occupancy_mask)
-        magic_index = get_magic_index(occupancy, magic_number, num_relevant_bits)  # Get magic index
-
-        # Magic index is guaranteed to be in bounds due to the masking in get_magic_index
-        attack_table[magic_index] = compute_rook_attacks(square, occupancy)
-
-    return attack_table
-
+def bishop_occupancy_mask(square):
+    """
+    Squares whose occupancy matters for a bishop on square, again without the board edge.
+    """
+    rank = square // 8
+    file = square % 8
+    mask = 0
+    for d_rank, d_file in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+        r = rank + d_rank
+        f = file + d_file
+        while 1 <= r <= 6 and 1 <= f <= 6:
+            mask |= (1 << (r * 8 + f))
+            r += d_rank
+            f += d_file
+    return mask
 
 
 def index_to_occupancy(index, mask):
+    """
+    Spread the bits of index over the set bits of mask (lowest index bit -> lowest mask bit).
+    Every index in range(1 << popcount(mask)) gives a different subset of mask.
+    """
     occupancy = 0
-    mask_bits = bin(mask)[2:][::-1]
-    index_bits = bin(index)[2:][::-1]
-
-    for i, bit in enumerate(mask_bits):
-        if bit == '1':
-            if i < len(index_bits) and index_bits[i] == '1':
-                occupancy |= (1 << i)
+    bit = 0
+    while mask:
+        lowest = mask & -mask
+        if index & (1 << bit):
+            occupancy |= lowest
+        mask ^= lowest
+        bit += 1
     return occupancy
 
+
 def get_magic_index(occupancy, magic_number, num_relevant_bits):
     # Multiply the occupancy by the magic number, shift right, and apply a mask
     return ((occupancy * magic_number) >> (64 - num_relevant_bits)) & ((1 << num_relevant_bits) - 1)
 
 
+def compute_sliding_attacks(square, occupancy, directions):
+    attacks = 0
+    # Slide from square in each direction, stopping after the first occupied square
+    for d_rank, d_file in directions:
+        r = square // 8 + d_rank
+        f = square % 8 + d_file
+        while 0 <= r < 8 and 0 <= f < 8:
+            attacks |= (1 << (r * 8 + f))
+            if occupancy & (1 << (r * 8 + f)):  # Stop on occupied
+                break
+            r += d_rank
+            f += d_file
+    return attacks
+
 
 def compute_rook_attacks(square, occupancy):
-    attacks = 0
-    # Add sliding attacks in 4 directions (left, right, up, down)
-    # Stop sliding when hitting an occupied square
-    # Left
-    for i in range((square % 8) - 1, -1, -1):
-        attacks |= (1 << ((square // 8) * 8 + i))
-        if occupancy & (1 << ((square // 8) * 8 + i)):  # Stop on occupied
-            break
-    # Right
-    for i in range((square % 8) + 1, 8):
-        attacks |= (1 << ((square // 8) * 8 + i))
-        if occupancy & (1 << ((square // 8) * 8 + i)):
-            break
-    # Up
-    for i in range((square // 8) - 1, -1, -1):
-        attacks |= (1 << (i * 8 + square % 8))
-        if occupancy & (1 << (i * 8 + square % 8)):
-            break
-    # Down
-    for i in range((square // 8) + 1, 8):
-        attacks |= (1 << (i * 8 + square % 8))
-        if occupancy & (1 << (i * 8 + square % 8)):
-            break
+    # Left, right, up, down
+    return compute_sliding_attacks(square, occupancy, ((0, -1), (0, 1), (-1, 0), (1, 0)))
 
-    return attacks
+
+def compute_bishop_attacks(square, occupancy):
+    return compute_sliding_attacks(square, occupancy, ((-1, -1), (-1, 1), (1, -1), (1, 1)))
+
+
+def generate_attack_table(square, magic_number, occupancy_mask, compute_attacks):
+    """
+    Build the attack table for one square. Raises ValueError if magic_number maps two
+    occupancies with different attack sets onto the same index.
+    """
+    num_relevant_bits = bin(occupancy_mask).count('1')
+
+    attack_table_size = 1 << num_relevant_bits  # Calculate the size of the attack table
+    attack_table = [None] * attack_table_size   # Initialize the attack table
+
+    # Walk every subset of the mask (carry-rippler trick), starting from the empty board
+    occupancy = 0
+    for _ in range(attack_table_size):
+        magic_index = get_magic_index(occupancy, magic_number, num_relevant_bits)  # Get magic index
+        attacks = compute_attacks(square, occupancy)
+        if attack_table[magic_index] is None:
+            attack_table[magic_index] = attacks
+        elif attack_table[magic_index] != attacks:
+            raise ValueError(f"magic number {magic_number:#x} collides on square {square}")
+        occupancy = (occupancy - occupancy_mask) & occupancy_mask
+
+    # Unused slots are never looked up
+    return [attacks or 0 for attacks in attack_table]
+
+
+def generate_rook_attack_table(square, magic_number):
+    return generate_attack_table(square, magic_number, rook_occupancy_mask(square), compute_rook_attacks)
+
+
+def generate_bishop_attack_table(square, magic_number):
+    return generate_attack_table(square, magic_number, bishop_occupancy_mask(square), compute_bishop_attacks)
+
+
+def find_magic_number(square, occupancy_mask, compute_attacks, rng=random, max_tries=10000000):
+    """
+    Search for a collision-free magic number for square by trying sparse random candidates.
+    """
+    num_relevant_bits = bin(occupancy_mask).count('1')
+    occupancies = [index_to_occupancy(index, occupancy_mask) for index in range(1 << num_relevant_bits)]
+    attacks = [compute_attacks(square, occupancy) for occupancy in occupancies]
+
+    for _ in range(max_tries):
+        magic_number = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+        # Quick reject: the top byte of mask * magic must be well populated
+        if bin((occupancy_mask * magic_number) & 0xFF00000000000000).count('1') < 6:
+            continue
+        used = {}
+        for occupancy, attack in zip(occupancies, attacks):
+            magic_index = get_magic_index(occupancy, magic_number, num_relevant_bits)
+            if used.setdefault(magic_index, attack) != attack:
+                break
+        else:
+            return magic_number
+    raise ValueError(f"no magic number found for square {square}")
+
+
+def find_all_magic_numbers(seed=None):
+    """
+    Find a full set of rook and bishop magic numbers, returned as two 64-entry lists.
+    """
+    rng = random.Random(seed)
+    rooks = [find_magic_number(square, rook_occupancy_mask(square), compute_rook_attacks, rng)
+             for square in range(64)]
+    bishops = [find_magic_number(square, bishop_occupancy_mask(square), compute_bishop_attacks, rng)
+               for square in range(64)]
+    return rooks, bishops
+
+
+if __name__ == "__main__":
+    for name, numbers in zip(("ROOK_MAGIC_NUMBERS", "BISHOP_MAGIC_NUMBERS"), find_all_magic_numbers()):
+        print(name + " = [")
+        for start in range(0, 64, 4):
+            print("    " + ", ".join(f"{number:#x}" for number in numbers[start:start + 4]) + ",")
+        print("]")
@@ -0,0 +1,38 @@
+"""
+Fixed-size caches of scores keyed by a 64-bit Zobrist key, for evaluation terms that are asked for again
+and again: the pawn structure (PawnStructure.PawnHashTable) and the whole static score
+(ChessAI.EvaluationCache).
+"""
+from array import array
+
+
+class ScoreCache:
+    """
+    Direct-mapped cache: one entry per masked key, in two flat arrays holding the full key and the score.
+    A new key simply overwrites whatever shared its entry. score_type is the array typecode of the
+    scores, "d" for floats or "q" for integers such as packed scores. An entry is written in two steps,
+    so a cache belongs to one search (see ChessAI.Searcher) and is never shared between threads.
+    """
+
+    def __init__(self, entries, score_type="d"):
+        self.mask = entries - 1  # entries must be a power of two
+        self.keys = array("Q", bytes(8 * entries))
+        self.scores = array(score_type, bytes(8 * entries))
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        """
+        The score stored for key, or None if it is not cached.
+        """
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        index = key & self.mask
+        self.keys[index] = key
+        self.scores[index] = score
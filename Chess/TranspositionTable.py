@@ -0,0 +1,129 @@
+"""
+Transposition table for the AI search: earlier search results keyed by the Zobrist key of the
+position (GameState.zobrist_key), kept in a fixed amount of memory. A table can be placed in shared
+memory, so several search processes read and write the same entries (lazy SMP, see ChessAI).
+"""
+from array import array
+from multiprocessing import shared_memory
+
+# Bound types: the stored score is exact, a lower bound (the search failed high) or an upper bound
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+DEFAULT_SIZE_MB = 16
+ENTRY_SIZE = 16  # Bytes per entry: the checked key and the packed data, 8 bytes each
+SCORE_SCALE = 10000  # Scores are stored as fixed point with this many steps per pawn
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table stored in one flat array of 64-bit words, two per entry: a data word packing
+    the best move (16 bits), depth (8 bits), bound (2 bits), age (6 bits) and the score (32 bits, fixed
+    point), and the key XORed with the data word. Processes sharing the table write without locks; an
+    entry torn by two simultaneous writes no longer XORs back to its key and reads as missing.
+    Entries are grouped in buckets of two: the first slot keeps the deepest result (unless it is left
+    over from an earlier search), the second always takes whatever did not go into the first.
+    """
+
+    def __init__(self, size_mb=DEFAULT_SIZE_MB, shared=False):
+        self.shared = shared
+        self.shared_memory = None
+        self.owner = False  # Whether this process created the shared memory and must unlink it
+        self.resize(size_mb)
+
+    @classmethod
+    def attach(cls, name, size, age=0):
+        """
+        Open a shared table created by another process, given its shared_memory name and size in entries.
+        """
+        table = cls.__new__(cls)
+        table.shared = True
+        table.shared_memory = shared_memory.SharedMemory(name)
+        table.owner = False
+        table.setStorage(size, table.shared_memory.buf.cast("Q"))
+        table.age = age
+        return table
+
+    def setStorage(self, size, entries):
+        self.size = size
+        self.bucket_mask = self.size - 2  # Index of the first slot of a bucket, always even
+        self.entries = entries
+        self.probes = 0
+        self.hits = 0
+
+    def resize(self, size_mb):
+        """
+        Reallocate the table to use at most size_mb megabytes, dropping all entries.
+        """
+        entries = max(2, int(size_mb * 1024 * 1024) // ENTRY_SIZE)
+        size = 1 << (entries.bit_length() - 1)  # A power of two, so a bucket is found by masking
+        if self.shared:
+            self.close()
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=ENTRY_SIZE * size)
+            self.owner = True
+            self.setStorage(size, self.shared_memory.buf.cast("Q"))
+            self.shared_memory.buf[:ENTRY_SIZE * size] = bytes(ENTRY_SIZE * size)
+        else:
+            self.setStorage(size, array("Q", bytes(ENTRY_SIZE * size)))
+        self.age = 0
+
+    def clear(self):
+        """
+        Forget every entry, e.g. at the start of a new game.
+        """
+        if self.shared:
+            self.shared_memory.buf[:ENTRY_SIZE * self.size] = bytes(ENTRY_SIZE * self.size)
+            self.probes = self.hits = self.age = 0
+        else:
+            self.resize(self.size * ENTRY_SIZE / (1024 * 1024))
+
+    def close(self):
+        """
+        Release a shared table; the process that created it also frees the memory.
+        """
+        if self.shared_memory is not None:
+            self.entries.release()
+            self.shared_memory.close()
+            if self.owner:
+                self.shared_memory.unlink()
+            self.shared_memory = None
+
+    def newSearch(self):
+        """
+        Start a new search: entries from earlier searches become the first to be replaced.
+        """
+        self.age = (self.age + 1) & 63
+
+    def probe(self, key):
+        """
+        Look up a position. Returns (best_move, depth, bound, score), or None if it is not stored.
+        """
+        self.probes += 1
+        entries = self.entries
+        index = (key & self.bucket_mask) << 1
+        data = entries[index + 1]
+        if entries[index] ^ data != key:
+            data = entries[index + 3]
+            if entries[index + 2] ^ data != key:
+                return None
+        self.hits += 1
+        score = data >> 32
+        if score >= 1 << 31:
+            score -= 1 << 32
+        return data & 0xFFFF, data >> 16 & 0xFF, data >> 24 & 3, score / SCORE_SCALE
+
+    def store(self, key, best_move, depth, bound, score):
+        """
+        Record a search result for a position, following the bucket replacement policy.
+        """
+        entries = self.entries
+        index = (key & self.bucket_mask) << 1
+        first = entries[index + 1]
+        if entries[index] ^ first != key and (entries[index + 2] ^ entries[index + 3] == key or
+                                              first >> 26 & 63 == self.age and first >> 16 & 0xFF > depth):
+            index += 2  # Keep the deeper entry from this search, overwrite the other slot
+        old = entries[index + 1]
+        if not best_move and entries[index] ^ old == key:
+            best_move = old & 0xFFFF  # A result without a best move keeps the one already known
+        data = best_move | min(max(depth, 0), 255) << 16 | bound << 24 | self.age << 26 | \
+            (round(score * SCORE_SCALE) & 0xFFFFFFFF) << 32
+        entries[index] = key ^ data
+        entries[index + 1] = data
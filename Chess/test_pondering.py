@@ -0,0 +1,52 @@
+"""
+Tests of pondering in ChessAI.Searcher. Run from this directory with: python -m unittest test_pondering
+"""
+import threading
+import time
+import unittest
+
+import ChessAI
+import ChessEngine
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+class PonderHitTest(unittest.TestCase):
+
+    def ponder(self, seconds, limits):
+        """
+        Ponder on the kiwipete position for seconds, then signal a ponder-hit. Returns the SearchResult
+        and the seconds the search took after the hit.
+        """
+        game_state = ChessEngine.GameState()
+        game_state.loadFEN(KIWIPETE)
+        ponder_hit = threading.Event()
+        outcome = {}
+
+        def run():
+            outcome["result"] = ChessAI.Searcher().search(game_state, limits, ponder_hit=ponder_hit)
+            outcome["end"] = time.perf_counter()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(seconds)
+        hit_time = time.perf_counter()
+        ponder_hit.set()
+        thread.join(30)
+        self.assertFalse(thread.is_alive())
+        return outcome["result"], outcome["end"] - hit_time
+
+    def testLongPonderReturnsAtOnce(self):
+        # The pondering took longer than the move time, so it is all used up
+        result, elapsed = self.ponder(2.0, ChessAI.SearchLimits(move_time=1000))
+        self.assertLess(elapsed, 0.25)
+        self.assertNotEqual(result.best_move, ChessEngine.NO_MOVE)
+
+    def testShortPonderKeepsTheRest(self):
+        result, elapsed = self.ponder(0.2, ChessAI.SearchLimits(move_time=1000))
+        self.assertLess(elapsed, 1.0)
+        self.assertNotEqual(result.best_move, ChessEngine.NO_MOVE)
+
+
+if __name__ == "__main__":
+    unittest.main()